@@ -0,0 +1,156 @@
+"""
+    benchmarks/standins.py
+    Local stand-ins for WordPress, the Flask API and AWS used by the benchmarks
+
+    Run as `python standins.py api -p PORT` to serve the stub API in the foreground
+"""
+
+import json
+import math
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures' / 'wordpress.json'
+WP_PREFIX = '/wp-json/wp/v2'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class StandIn:
+    """Threaded http server counting the requests it serves"""
+    handler = None
+
+    def __init__(self, port=0):
+        handler = type('Handler', (self.handler, ), {'standin': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        body = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class WordPressHandler(QuietHandler):
+    """Serves the recorded WordPress fixtures"""
+
+    def do_GET(self):
+        self.standin.count()
+        fixtures = self.standin.fixtures
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path == '/staff/':
+            if 'writer' in query:
+                return self.send_body(200, fixtures['profiles'][unquote(query['writer'][0])], 'text/html')
+            return self.send_body(200, fixtures['staff'].replace('{base}', self.standin.url), 'text/html')
+        path = parts.path[len(WP_PREFIX):].strip('/').split('/')
+        if path == ['posts']:
+            per_page = int(query.get('per_page', ['10'])[0])
+            page = int(query.get('page', ['1'])[0])
+            posts = fixtures['posts']
+            pages = max(math.ceil(len(posts) / per_page), 1)
+            chunk = posts[(page - 1) * per_page:page * per_page]
+            return self.send_body(200, json.dumps(chunk), headers={
+                'X-WP-Total': str(len(posts)), 'X-WP-TotalPages': str(pages)})
+        if len(path) == 2 and path[0] in ('users', 'media', 'categories'):
+            record = fixtures[path[0]].get(path[1])
+            if record is not None:
+                return self.send_body(200, json.dumps(record))
+        self.send_body(404, json.dumps({'code': 'rest_no_route'}))
+
+
+class FakeWordPress(StandIn):
+    handler = WordPressHandler
+
+    def __init__(self, port=0, fixtures=FIXTURES):
+        super().__init__(port)
+        self.fixtures = json.loads(Path(fixtures).read_text())
+
+
+class APIHandler(QuietHandler):
+    """Accepts any write to /api/*"""
+
+    def do_POST(self):
+        self.standin.count()
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/api/'):
+            return self.send_body(404, '{}')
+        self.send_body(201, '{"status": "created"}')
+
+    def do_GET(self):
+        self.standin.count()
+        self.send_body(200, '[]')
+
+
+class StubAPI(StandIn):
+    handler = APIHandler
+
+
+class FakeAWS(StandIn):
+    """moto server for DynamoDB and S3"""
+
+    def __init__(self, port=0):
+        from moto.server import DomainDispatcherApplication, create_backend_app
+        from werkzeug.serving import make_server
+        app = DomainDispatcherApplication(create_backend_app)
+
+        def counted(environ, start_response):
+            self.count()
+            return app(environ, start_response)
+        self.server = make_server('127.0.0.1', port, counted, threaded=True)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('api', 'wordpress'):
+        sys.exit("usage: standins.py api|wordpress [-p PORT]")
+    port = int(sys.argv[sys.argv.index('-p') + 1]) if '-p' in sys.argv else 0
+    standin = StubAPI(port) if sys.argv[1] == 'api' else FakeWordPress(port)
+    print(f"{sys.argv[1]} stand-in on {standin.url}", flush=True)
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
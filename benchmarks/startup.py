@@ -0,0 +1,76 @@
+"""
+    benchmarks/startup.py
+    Guards wb start up time using python -X importtime
+
+    Usage: python benchmarks/startup.py [--budget MS] [--top N]
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+
+# commands that must stay light, as passed to wb
+COMMANDS = [
+    ['--help'],
+    ['setaws', 'default'],
+    ['api', '--help'],
+]
+
+# heavy dependencies that only specific commands may import
+HEAVY = ['boto3', 'botocore', 'docker', 'git', 'psutil',
+         'requests', 'yaml', 'bs4', 'art', 'tabulate']
+
+RUNNER = "import sys, run; sys.argv = ['wb'] + sys.argv[1:]; run.cli()"
+
+
+def import_times(args):
+    """runs wb with args, returning its exit code and {module: (self_us, cumulative_us)}"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', RUNNER, *args],
+                          cwd=str(SRC), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    times = {}
+    for line in proc.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, module = line[len('import time:'):].split('|')
+        times[module[1:].rstrip()] = (int(self_us), int(cumulative))
+    return proc.returncode, times
+
+
+def top_level(times):
+    """cumulative import time of top level modules"""
+    return sum(cum for mod, (_, cum) in times.items() if mod == mod.lstrip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=float, default=150,
+                        help='maximum import time per command in ms')
+    parser.add_argument('--top', type=int, default=5,
+                        help='slowest imports to show per command')
+    opts = parser.parse_args()
+    failed = False
+    for args in COMMANDS:
+        code, times = import_times(args)
+        total = top_level(times) / 1000
+        heavy = sorted({m.strip().split('.')[0] for m in times} & set(HEAVY))
+        slowest = sorted(times.items(), key=lambda t: t[1][1], reverse=True)
+        print(f"wb {' '.join(args)}: {total:.1f}ms")
+        for mod, (_, cum) in slowest[:opts.top]:
+            print(f"    {cum / 1000:8.1f}ms  {mod.strip()}")
+        if code != 0:
+            print(f"    FAIL: exited with code {code}")
+            failed = True
+        if heavy:
+            print(f"    FAIL: imports {', '.join(heavy)}")
+            failed = True
+        if total > opts.budget:
+            print(f"    FAIL: over budget of {opts.budget:.0f}ms")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
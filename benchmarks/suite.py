@@ -0,0 +1,202 @@
+"""
+    benchmarks/suite.py
+    End to end benchmarks of the wb hot paths against local stand-ins
+
+    Usage: python benchmarks/suite.py [--repeat N] [--save-baseline] [--tolerance 0.25] [CASE...]
+
+    Each case runs in a fresh interpreter with a temporary HOME, a fake
+    WordPress, a stub Flask API and a moto server (pip install "moto[server]")
+    standing in for DynamoDB and S3. Wall time, requests served by the
+    stand-ins and peak RSS are compared against baseline.json. The committed
+    baseline pins only the deterministic request counts of the cases whose
+    requests all reach a stand-in (Docker calls and the stub API run by
+    wb api start are not counted); --save-baseline adds this machine's wall
+    time and peak RSS.
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+SRC = HERE.parent / 'src'
+BASELINE = HERE / 'baseline.json'
+CASES = ['status', 'api_start_stop', 'setup_resources',
+         'upload_sample_data', 'upload_scraped_data']
+
+
+class Bench:
+    """Stand-ins and patched endpoints for a single case"""
+
+    def __init__(self, needs_aws=False):
+        import standins
+        sys.path.insert(0, str(SRC))
+        from utils import ServiceLog
+        self.log = ServiceLog('Bench', 'green')
+        self.wordpress = standins.FakeWordPress().start()
+        self.api = standins.StubAPI().start()
+        self.aws = standins.FakeAWS().start() if needs_aws else None
+        self.patch()
+
+    def patch(self):
+        from services import resource, scrape
+        scrape.base_url = f"{self.wordpress.url}/wp-json/wp/v2"
+        scrape.staff_url = f"{self.wordpress.url}/staff/"
+        scrape.local_url = f"{self.api.url}/api/"
+        resource.post_url = f"{self.api.url}/api/posts"
+        if self.aws:
+            for endpoint in resource.ENDPOINTS.values():
+                endpoint.update(endpoint_url=self.aws.url, region_name='us-east-1',
+                                aws_access_key_id='testing', aws_secret_access_key='testing')
+
+    @property
+    def requests(self):
+        return sum(s.requests for s in (self.wordpress, self.api, self.aws) if s)
+
+    def close(self):
+        import psutil
+        from services.supervisor import terminate_tree
+        self.wordpress.stop()
+        self.api.stop()
+        if self.aws:
+            self.aws.stop()
+        # anything a case spawned and failed to stop, such as the stub api
+        for child in psutil.Process().children():
+            terminate_tree(child, timeout=1)
+
+
+def wb(*args):
+    from run import cli
+    cli.main(list(args), prog_name='wb', standalone_mode=False)
+
+
+def case_status(bench):
+    wb('status')
+
+
+def case_api_start_stop(bench):
+    import standins
+    from git import Repo
+    from services import api, ready
+    api_dir = Path(tempfile.mkdtemp())
+    Repo.init(str(api_dir)).create_remote(
+        'origin', 'https://github.com/WarriorBeat/WarriorBeatApi.git')
+    os.environ['API_DIR'] = str(api_dir)
+    port = standins.free_port()
+    api.FLASK['api'].update(port=str(port),
+                            args=f'"{sys.executable}" "{HERE / "standins.py"}" api')
+    ready.READINESS['api']['port'] = port
+    wb('api', 'start', 'api', '--test')
+    wb('api', 'stop', 'api')
+
+
+def case_setup_resources(bench):
+    from services import resource
+    resource.setup_resources(bench.log)
+
+
+def case_upload_sample_data(bench):
+    from services import resource
+    resource.upload_sample_data(bench.log)
+
+
+def case_upload_scraped_data(bench):
+    from services import scrape
+    scrape.upload_scraped_data(bench.log, workers=8)
+
+
+def run_case(name, out):
+    """runs one case in this process, writing its measurements to out"""
+    bench = Bench(needs_aws=name == 'setup_resources')
+    try:
+        start = time.perf_counter()
+        globals()[f"case_{name}"](bench)
+        wall = time.perf_counter() - start
+    finally:
+        bench.close()
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+    Path(out).write_text(json.dumps({
+        'wall': wall, 'requests': bench.requests, 'peak_rss_mb': peak / 2 ** 20}))
+
+
+def measure(name, repeat):
+    """median measurements of a case over fresh interpreters"""
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as home:
+            out = Path(home) / 'result.json'
+            env = dict(os.environ, HOME=home, AWS_ACCESS_KEY_ID='testing',
+                       AWS_SECRET_ACCESS_KEY='testing', PYTHONPATH=str(SRC))
+            proc = subprocess.run([sys.executable, __file__, '--case', name, '--out', str(out)],
+                                  cwd=str(HERE), env=env, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.PIPE)
+            if proc.returncode != 0:
+                raise RuntimeError(f"{name} failed:\n{proc.stderr.decode('utf-8')}")
+            runs.append(json.loads(out.read_text()))
+    return {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+
+
+def compare(results, baseline, tolerance):
+    """rows of results against baseline and whether any regressed"""
+    rows, regressed = [], False
+    for name, result in results.items():
+        base = baseline.get(name)
+        verdict = 'new'
+        if base:
+            # the committed baseline only pins request counts, timings are per machine
+            slower = 'wall' in base and result['wall'] > base['wall'] * (1 + tolerance)
+            heavier = ('peak_rss_mb' in base
+                       and result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance))
+            chattier = 'requests' in base and result['requests'] > base['requests']
+            problems = [p for p, bad in (('wall', slower), ('rss', heavier),
+                                         ('requests', chattier)) if bad]
+            verdict = 'REGRESSED: ' + ', '.join(problems) if problems else 'ok'
+            regressed = regressed or bool(problems)
+        rows.append([name, f"{result['wall']:.3f}s",
+                     f"{base['wall']:.3f}s" if base and 'wall' in base else '-',
+                     int(result['requests']), f"{result['peak_rss_mb']:.1f}MB", verdict])
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cases', nargs='*', metavar='CASE', default=CASES,
+                        help=f"any of: {', '.join(CASES)}")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed fractional slowdown before failing')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+    if opts.case:
+        return run_case(opts.case, opts.out)
+
+    unknown = set(opts.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    from tabulate import tabulate
+    results = {name: measure(name, opts.repeat) for name in opts.cases}
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    rows, regressed = compare(results, baseline, opts.tolerance)
+    print(tabulate(rows, headers=['Case', 'Wall', 'Baseline', 'Requests', 'Peak RSS', ''],
+                   tablefmt="fancy_grid"))
+    if opts.save_baseline:
+        BASELINE.write_text(json.dumps(dict(baseline, **results), indent=2))
+        print(f"Baseline saved to {BASELINE}")
+    elif regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
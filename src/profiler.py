@@ -0,0 +1,119 @@
+"""
+    profiler.py
+    Profiling hooks for wb commands
+
+    cprofile -> <command>-<mode>-<time>.pstats (snakeviz, flameprof, pstats)
+    wall     -> <command>-<mode>-<time>.folded (flamegraph.pl, speedscope)
+    alloc    -> <command>-<mode>-<time>.folded, weighted by bytes still allocated at exit
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from click import echo
+
+
+def frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class WallSampler:
+    """Samples the stacks of every thread on a fixed interval"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = False
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        me = threading.get_ident()
+        while self.running:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+class Profiler:
+    """Wraps a command with cProfile, a wall clock sampler or tracemalloc"""
+
+    def __init__(self, mode, command, path, top=15):
+        self.mode = mode
+        self.top = top
+        path.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        ext = 'pstats' if mode == 'cprofile' else 'folded'
+        self.output = path / f"{command or 'wb'}-{mode}-{stamp}.{ext}"
+        self.profile = None
+
+    def start(self):
+        if self.mode == 'cprofile':
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.mode == 'wall':
+            self.profile = WallSampler()
+            self.profile.start()
+        else:
+            import tracemalloc
+            tracemalloc.start(10)
+        self.started = time.perf_counter()
+
+    def stop(self):
+        elapsed = time.perf_counter() - self.started
+        getattr(self, f"_stop_{self.mode}")()
+        echo(f"\nProfile ({self.mode}, {elapsed:.2f}s) saved to {self.output}")
+
+    def _stop_cprofile(self):
+        import pstats
+        self.profile.disable()
+        self.profile.dump_stats(str(self.output))
+        pstats.Stats(self.profile).sort_stats('cumulative').print_stats(self.top)
+
+    def _stop_wall(self):
+        self.profile.stop()
+        stacks = self.profile.stacks
+        self._write_folded(stacks)
+        total = sum(stacks.values()) or 1
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        echo(f"\nTop {self.top} frames by wall samples:")
+        for frame, count in leaves.most_common(self.top):
+            echo(f"{100 * count / total:6.1f}%  {frame}")
+
+    def _stop_alloc(self):
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stacks = Counter()
+        for stat in snapshot.statistics('traceback'):
+            stack = ';'.join(f"{os.path.basename(f.filename)}:{f.lineno}"
+                             for f in reversed(stat.traceback))
+            stacks[stack] += stat.size
+        self._write_folded(stacks)
+        echo(f"\nTop {self.top} allocation sites:")
+        for stat in snapshot.statistics('lineno')[:self.top]:
+            echo(f"{stat.size / 1024:10.1f}KB  {stat.traceback[0]}")
+
+    def _write_folded(self, stacks):
+        with self.output.open('w') as f:
+            for stack, count in stacks.items():
+                f.write(f"{stack} {count}\n")
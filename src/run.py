@@ -6,26 +6,37 @@
     for WarriorBeat purposes. Not the most clean program out there...
 """
 
+import io
 import os
 import subprocess as subp
 import time
+from pathlib import Path
 
 import click
-from art import text2art
-from tabulate import tabulate
 
 from services import Service
 from utils import ServiceLog
 
 s = ServiceLog('WBCLI', 'bright_blue', root=True)
+# keys of services.docker.PROFILES, kept here so --help does not import docker
+PERF_PROFILES = ['default', 'fast', 'persistent']
 
 
 @click.version_option(prog_name="WarriorBeatCli")
 @click.group()
-def cli():
+@click.option('--profile', help='Profile the command', type=click.Choice(['cprofile', 'wall', 'alloc']))
+@click.option('--profile-top', help='Hotspots to print when profiling', default=15, show_default=True)
+@click.pass_context
+def cli(ctx, profile, profile_top):
     """
     Simple Command line tool for managing WarriorBeat Services
     """
+    if profile:
+        from profiler import Profiler
+        profiler = Profiler(profile, ctx.invoked_subcommand,
+                            s.config_path / 'profiles', top=profile_top)
+        profiler.start()
+        ctx.call_on_close(profiler.stop)
 
 
 @cli.command()
@@ -37,58 +48,117 @@ def setaws(profile):
     click.secho(f'{profile}', fg='cyan', bold=True)
 
 
+CLEAN_TOOLS = ['autoflake', 'autopep8', 'isort']
+CLEAN_SHARD_SIZE = 50
+
+
+def clean_args(tool, paths, in_place):
+    """command line for a clean tool over paths"""
+    if tool == 'autoflake':
+        flags = ['--in-place'] if in_place else []
+        return ['autoflake', '--remove-all-unused-imports', *flags, *paths]
+    if tool == 'autopep8':
+        return ['autopep8', '-i' if in_place else '-d', *paths]
+    flags = [] if in_place else ['--diff', '--check-only']
+    return ['isort', *flags, *paths]
+
+
+def find_sources(path):
+    """python files under path, skipping hidden and cache directories"""
+    path = Path(path)
+    if path.is_file():
+        return [str(path)]
+    return sorted(str(p) for p in path.rglob('*.py')
+                  if not any(part.startswith('.') or part == '__pycache__'
+                             for part in p.relative_to(path).parts))
+
+
+def run_clean_tools(tools, paths, in_place):
+    """runs tools over one shard in order, returning (tool, code, output, elapsed)"""
+    results = []
+    for tool in tools:
+        start = time.perf_counter()
+        try:
+            proc = subp.run(clean_args(tool, paths, in_place),
+                            stdout=subp.PIPE, stderr=subp.STDOUT)
+            code, output = proc.returncode, proc.stdout
+        except FileNotFoundError:
+            code, output = 127, f"{tool} is not installed\n".encode('utf-8')
+        results.append((tool, code, output, time.perf_counter() - start))
+    return results
+
+
 @cli.command()
 @click.option('--in-place', help='Make the changes', is_flag=True)
+@click.option('--jobs', '-j', help='Parallel worker processes', default=os.cpu_count() or 1, show_default=True, type=click.IntRange(1))
 @click.argument('path', type=click.Path(exists=True, resolve_path=True), default='.')
-def clean(path, in_place):
+@click.pass_context
+def clean(ctx, path, in_place, jobs):
     '''
     Recursively clean project with autoflake, autopep8, and isort.
     Requires autoflake, autopep8, and isort.
     Default: Current Directory
     '''
-    s.info("Running autoflake...")
-    flake_args = ['autoflake', '--remove-all-unused-imports', '-r', path]
-    if in_place:
-        del flake_args[3]
-        flake_args.extend(['--in-place', path])
-    flake_proc = subp.Popen(flake_args, stdout=subp.PIPE)
-    for l in s.diff_print(flake_proc.stdout.readline):
-        click.echo(l)
-    s.info('Autoflake complete')
-    s.info('Starting autopep8...')
-    time.sleep(3)
-    pep_args = ['autopep8', '-rd', path]
-    if in_place:
-        pep_args[1] = '-ri'
-    pep_proc = subp.Popen(pep_args)
-    s.info('Autopep8 complete')
-    s.info('Starting isort...')
-    time.sleep(3)
-    sort_args = ['isort', '-rc', '--diff', '--check-only', path]
+    from concurrent.futures import ProcessPoolExecutor
+    from tabulate import tabulate
+    sources = find_sources(path)
+    shards = [sources[i:i + CLEAN_SHARD_SIZE]
+              for i in range(0, len(sources), CLEAN_SHARD_SIZE)]
     if in_place:
-        del sort_args[2]
-        del sort_args[2]
-    sort_proc = subp.Popen(sort_args, stdout=subp.PIPE)
-    for l in s.diff_print(sort_proc.stdout.readline):
-        click.echo(l)
+        # each shard runs the tools in dependency order
+        s.info(f"Cleaning $[{len(sources)}] files in place...")
+        work = [(CLEAN_TOOLS, shard) for shard in shards]
+    else:
+        # diffs are independent, so every tool runs at once
+        s.info(f"Checking $[{len(sources)}] files...")
+        work = [([tool], shard) for tool in CLEAN_TOOLS for shard in shards]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_clean_tools, tools, shard, in_place)
+                   for tools, shard in work]
+        results = [r for f in futures for r in f.result()]
+    summary = []
+    for tool in CLEAN_TOOLS:
+        runs = [r for r in results if r[0] == tool]
+        output = b''.join(r[2] for r in runs)
+        for l in s.diff_print(io.BytesIO(output).readline):
+            click.echo(l)
+        code = max((r[1] for r in runs), default=0)
+        summary.append([tool, f"{sum(r[3] for r in runs):.2f}s", code])
+    click.echo(tabulate(summary, headers=['Tool', 'Time', 'Exit'],
+                        tablefmt="fancy_grid", stralign="center"))
+    exit_code = max((row[2] for row in summary), default=0)
     s.info('Cleaning Complete')
+    ctx.exit(exit_code)
 
 
-@cli.command()
-def status():
-    '''
-    View active services
-    '''
+STATUS_HEADERS = ['Service', 'Running', 'Uptime', 'CPU', 'RSS', 'Restarts']
+
+
+def render_status(rows, headers=STATUS_HEADERS):
+    """clears the screen and draws the status table"""
+    from art import text2art
+    from tabulate import tabulate
     s.clear()
     title = text2art('WB CLI', font='swampland')
     run = click.style('\u2714', fg='green')
     stop = click.style('\u2718', fg='red')
-    _status = [Service(s).status() for s in Service.SERVICE_LIST]
-    status = [list(run if r == True else stop if r == False else r for r in st)
-              for st in _status]
+    status = [list(run if r is True else stop if r is False else r for r in st)
+              + ['-'] * (len(headers) - len(st)) for st in rows]
     click.secho(title, fg='bright_cyan')
-    click.echo(tabulate(status, headers=[
-               'Service', 'Running'], tablefmt="fancy_grid", stralign="center"))
+    click.echo(tabulate(status, headers=headers,
+                        tablefmt="fancy_grid", stralign="center"))
+
+
+@cli.command()
+@click.option('--watch', '-w', help='Keep the view updated as services change', is_flag=True)
+def status(watch):
+    '''
+    View active services
+    '''
+    if watch:
+        from services.watch import Dashboard
+        return Dashboard(lambda rows: render_status(rows, STATUS_HEADERS[:2])).run()
+    render_status(Service.status_all())
 
 
 @cli.group()
@@ -104,8 +174,17 @@ def api():
 @click.option('--live', '-l', help='Connect to AWS Server', is_flag=True)
 @click.option('--test', '-t',  help='Skips resource creation (for Unit tests)', is_flag=True)
 @click.option('--sample-data', '-s',  help='Upload Sample Data to API', is_flag=True)
+@click.option('--bulk', '-b',  help='Write sample data directly to DynamoDB', is_flag=True)
 @click.option('--scrape-data', '-S',  help='Upload Data Scraped from Website', is_flag=True)
+@click.option('--mirror-media', help='Copy scraped images into the local media bucket', is_flag=True)
 @click.option('--ngrok', '-n',  help='Start ngrok Tunnel', is_flag=True)
+@click.option('--supervise', help='Stay attached and restart the API and ngrok if they crash', is_flag=True)
+@click.option('--offline', help='Scrape from the local response cache and load images from saved tarballs', is_flag=True)
+@click.option('--per-page', help='WordPress posts fetched per page', default=20, show_default=True, type=click.IntRange(1, 100))
+@click.option('--max-posts', help='Stop scraping after this many posts', type=click.IntRange(1))
+@click.option('--metrics-json', help='Export request metrics of data uploads to a JSON file', type=click.Path(dir_okay=False, writable=True))
+@click.option('--workers', '-w', help='Concurrent workers for data scraping (1 = serial)', default=8, show_default=True)
+@click.option('--perf-profile', '-p', help='Container profile, recreates containers made with another', type=click.Choice(PERF_PROFILES))
 @click.argument('service', default='all', type=click.Choice([*Service.SERVICE_LIST, 'all']))
 def start(service, *args, **kwargs):
     """
@@ -114,7 +193,11 @@ def start(service, *args, **kwargs):
     if service == 'all':
         s.info(
             f"Starting all services: $[{', '.join(map(str, [s for s in Service.SERVICE_LIST]))}]\n")
-        return [Service(s, *args, **kwargs).start() for s in Service.SERVICE_LIST]
+        if not kwargs['live']:
+            Service.prepare_all(offline=kwargs['offline'], perf_profile=kwargs['perf_profile'])
+        if Service.orchestrate(None, *args, **kwargs).start():
+            raise click.Abort()
+        return
     service = Service(service, *args, **kwargs)
     s.info(f"Starting $[{service.name}]\n")
     service.start()
@@ -127,7 +210,7 @@ def stop(service):
     if service == 'all':
         s.info(
             f"Stopping all services: $[{', '.join(map(str, [s for s in Service.SERVICE_LIST]))}]\n")
-        return [Service(s).stop() for s in Service.SERVICE_LIST]
+        return Service.orchestrate().stop()
     service = Service(service)
     s.info(f"Stopping $[{service.name}]\n")
     service.stop()
@@ -138,12 +221,108 @@ def stop(service):
 def restart(service):
     """Restarts the given service"""
     if service == 'all':
-        return [Service(s).restart() for s in Service.SERVICE_LIST]
+        if Service.orchestrate().restart():
+            raise click.Abort()
+        return
     service = Service(service)
     s.info(f"Restarting $[{service.name}]")
     service.restart()
 
 
+@api.command()
+@click.option('--offline', help='Only load images from the local tarball cache', is_flag=True)
+@click.option('--save', help='Save pulled images to the local tarball cache', is_flag=True)
+@click.option('--perf-profile', '-p', help='Pull the images of this container profile', type=click.Choice(PERF_PROFILES))
+def pull(offline, save, perf_profile):
+    """Pulls container images that are missing or behind the registry"""
+    s.info(f"Pulling images for $[{', '.join(Service.SERVICE_LIST)}]\n")
+    results = Service.prepare_all(offline=offline, save=save, perf_profile=perf_profile,
+                                  refresh=True)
+    if any(r is None for r in results.values()):
+        raise click.Abort()
+
+
+@api.command()
+def stats():
+    """Shows resource usage of the local containers"""
+    from tabulate import tabulate
+    from services.docker import DOCKER, DockerService
+    rows = DockerService.stats_all(list(DOCKER))
+    headers = ['Container', 'Profile', 'CPU', 'Memory', 'Net I/O', 'Block I/O']
+    click.echo(tabulate([row + ['-'] * (len(headers) - len(row)) for row in rows],
+                        headers=headers, tablefmt="fancy_grid", stralign="center"))
+
+
+@api.command()
+@click.option('--follow', '-f', help='Keep printing new output', is_flag=True)
+@click.option('--tail', '-n', help='Number of lines to show', default=20, show_default=True)
+def logs(follow, tail):
+    """Shows output of the Flask API"""
+    from services import logs as service_logs
+    path = service_logs.log_file(s.config_path, 'api')
+    for line in service_logs.tail(path, tail):
+        click.echo(line.decode('utf-8', 'replace'), nl=False)
+    if follow:
+        try:
+            for line in service_logs.follow(path):
+                click.echo(line.decode('utf-8', 'replace'), nl=False)
+        except KeyboardInterrupt:
+            pass
+
+
+@api.command()
+@click.argument('fixture', required=False, type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+def seed(fixture):
+    """Bulk loads a fixture file straight into local DynamoDB"""
+    from services import resource
+    log = ServiceLog('API', 'bright_magenta')
+    resource.bulk_load_sample_data(log, fixture or resource.sample_file)
+
+
+@api.group()
+def snapshot():
+    """Saves and restores local DynamoDB and S3 data"""
+    pass
+
+
+@snapshot.command('save')
+@click.argument('name')
+def snapshot_save(name):
+    """Dumps all tables and buckets to a named snapshot"""
+    from botocore.exceptions import ClientError
+    from services import snapshot as snapshots
+    log = ServiceLog('Snapshot', 'bright_magenta')
+    try:
+        snapshots.save(name, log)
+    except ClientError as e:
+        log.error(f"Failed to save snapshot {name}: {e}")
+        raise click.Abort()
+
+
+@snapshot.command('restore')
+@click.argument('name')
+def snapshot_restore(name):
+    """Writes a named snapshot back into the local tables and buckets"""
+    from botocore.exceptions import ClientError
+    from services import snapshot as snapshots
+    log = ServiceLog('Snapshot', 'bright_magenta')
+    try:
+        snapshots.restore(name, log)
+    except (FileNotFoundError, ValueError, ClientError) as e:
+        log.error(str(e))
+        raise click.Abort()
+
+
+@snapshot.command('list')
+def snapshot_list():
+    """Lists saved snapshots"""
+    from tabulate import tabulate
+    from services import snapshot as snapshots
+    rows = [[name, f"{size / 2 ** 20:.1f}MB", time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))]
+            for name, size, mtime in snapshots.list_snapshots(s.config_path)]
+    click.echo(tabulate(rows, headers=['Snapshot', 'Size', 'Saved'], tablefmt="fancy_grid"))
+
+
 @cli.group()
 def app():
     '''
@@ -152,6 +331,45 @@ def app():
     click.echo()
 
 
-# @app.command()
-# def start():
-#     pass
+def app_ids(service):
+    """plugin service ids selected by service"""
+    ids = Service.ids('plugin')
+    if not ids:
+        s.warn('No app services are registered')
+    if service == 'all':
+        return ids
+    if service not in ids:
+        raise click.BadParameter(f"{service} is not one of {', '.join(ids) or 'none'}")
+    return [service]
+
+
+@app.command('start')
+@click.argument('service', default='all')
+def app_start(service):
+    """Starts app services registered as plugins"""
+    for id in app_ids(service):
+        Service(id).start()
+
+
+@app.command('stop')
+@click.argument('service', default='all')
+def app_stop(service):
+    """Stops app services registered as plugins"""
+    for id in app_ids(service):
+        Service(id).stop()
+
+
+@app.command('restart')
+@click.argument('service', default='all')
+def app_restart(service):
+    """Restarts app services registered as plugins"""
+    for id in app_ids(service):
+        Service(id).restart()
+
+
+@app.command('status')
+def app_status():
+    """View app services registered as plugins"""
+    ids = app_ids('all')
+    if ids:
+        render_status(Service.status_all(ids))
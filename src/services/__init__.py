@@ -3,39 +3,174 @@
     Entry point for services. Contains Service Factory
 """
 
-from .docker import DockerService
-from .api import APIService
+from importlib import import_module
+
+PLUGIN_GROUP = 'wbcli.services'
+
+# static service metadata, providers are imported on first use
+SERVICES = {
+    'db': {
+        'name': 'localdynamo',
+        'provider': 'services.docker:DockerService',
+        'group': 'api'
+    },
+    's3': {
+        'name': 's3server',
+        'provider': 'services.docker:DockerService',
+        'group': 'api'
+    },
+    'api': {
+        'name': 'WarriorBeatApi',
+        'provider': 'services.api:APIService',
+        'group': 'api',
+        'depends': ['db', 's3']
+    },
+}
+
+
+def iter_plugins():
+    """(id, provider) pairs registered under the plugin entry point group"""
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        from pkg_resources import iter_entry_points
+        return [(ep.name, f"{ep.module_name}:{ep.attrs[0]}")
+                for ep in iter_entry_points(PLUGIN_GROUP)]
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=PLUGIN_GROUP)
+    else:
+        eps = eps.get(PLUGIN_GROUP, [])
+    return [(ep.name, ep.value) for ep in eps]
+
+
+class ServiceRegistry:
+    """Service ids and metadata with lazily imported providers"""
+
+    def __init__(self, services):
+        self.services = dict(services)
+        self.providers = {}
+        self.plugins_loaded = False
+
+    def load_plugins(self):
+        """registers entry point plugins, scanned at most once"""
+        if self.plugins_loaded:
+            return
+        self.plugins_loaded = True
+        for id, provider in iter_plugins():
+            # the name is read from the provider on first use
+            self.services.setdefault(
+                id, {'name': None, 'provider': provider, 'group': 'plugin'})
+
+    def get(self, id):
+        meta = self.services.get(id)
+        if meta is None and not self.plugins_loaded:
+            self.load_plugins()
+            meta = self.services.get(id)
+        assert meta is not None, f"{id} is not a valid service!"
+        return meta
+
+    def depends(self, id):
+        return self.get(id).get('depends', [])
+
+    def ids(self, group='api'):
+        if group == 'plugin':
+            self.load_plugins()
+        return [id for id, meta in self.services.items() if meta['group'] == group]
+
+    def provider(self, id):
+        """imports the provider class for a service id"""
+        path = self.get(id)['provider']
+        if path not in self.providers:
+            module, name = path.split(':')
+            self.providers[path] = getattr(import_module(module), name)
+        provider = self.providers[path]
+        meta, name = self.get(id), provider.SERVICES[id]['name']
+        if meta['name'] is None:
+            meta['name'] = name
+        assert meta['name'] == name, f"{id} is {meta['name']} in SERVICES but {name} in its provider"
+        return provider
+
+
+registry = ServiceRegistry(SERVICES)
+
+
+def group_status(ids):
+    """status of ids sharing a single provider"""
+    return registry.provider(ids[0]).status_all(ids)
 
 
 class ServiceManager:
     """Factory for Services"""
-    PROVIDERS = [DockerService, APIService]
-    SERVICE_LIST = [
-        serv for prov in PROVIDERS for serv in list(prov.SERVICES.keys())]
+    SERVICE_LIST = registry.ids()
 
     def __init__(self, id, *args, **kwargs):
         self.id = id
-        self.service = self.get_service(*args, **kwargs)
-        self.name = self.service.name
+        if registry.get(id)['name'] is None:
+            registry.provider(id)
+        self.name = registry.get(id)['name']
+        self._args = args
+        self._kwargs = kwargs
+        self._service = None
+
+    @property
+    def service(self):
+        """provider instance, constructed on first use"""
+        if self._service is None:
+            self._service = self.get_service(*self._args, **self._kwargs)
+        return self._service
 
     def get_service(self, *args, **kwargs):
-        for provider in self.PROVIDERS:
-            if provider.supports(self.id):
-                return provider(self.id, *args, **kwargs)
-        assert hasattr(
-            self, 'service') == True, f"{self.id} is not a valid service!"
+        return registry.provider(self.id)(self.id, *args, **kwargs)
 
     def start(self):
         self.service.start()
+        self.service.attach()
 
     def stop(self):
         self.service.stop()
 
     def restart(self):
         self.service.restart()
+        self.service.attach()
 
     def status(self):
         return self.service.status()
 
+    @classmethod
+    def ids(cls, group='api'):
+        return registry.ids(group)
+
+    @classmethod
+    def orchestrate(cls, ids=None, *args, **kwargs):
+        """orchestrator over ids honoring their declared dependencies"""
+        from .orchestrator import Orchestrator
+        return Orchestrator(ids or cls.SERVICE_LIST, cls, *args, **kwargs)
+
+    @classmethod
+    def prepare_all(cls, ids=None, **kwargs):
+        """runs the prepare phase of every provider, e.g. pulling images"""
+        ids = ids or cls.SERVICE_LIST
+        groups = {}
+        for id in ids:
+            groups.setdefault(registry.get(id)['provider'], []).append(id)
+        return {id: result for group in groups.values()
+                for id, result in registry.provider(group[0]).prepare_all(group, **kwargs).items()}
+
+    @classmethod
+    def status_all(cls, ids=None):
+        """collects status of services concurrently, one batch per provider"""
+        from concurrent.futures import ThreadPoolExecutor
+        ids = ids or cls.SERVICE_LIST
+        groups = {}
+        for id in ids:
+            groups.setdefault(registry.get(id)['provider'], []).append(id)
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            jobs = [(group, pool.submit(group_status, group))
+                    for group in groups.values()]
+            statuses = {id: status for group, job in jobs
+                        for id, status in zip(group, job.result())}
+        return [statuses[i] for i in ids]
+
 
 Service = ServiceManager
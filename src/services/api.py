@@ -5,23 +5,17 @@
 
 import os
 import subprocess as subp
-import threading
+import time
 from pathlib import Path
-from time import sleep
 
-import boto3
 import click
 import psutil
-import requests
-import yaml
-from botocore.exceptions import ClientError
-from git import Repo
 
 from utils import ServiceLog, ch_dir
 
-from . import resource as res
-from . import scrape
+from . import logs
 from .service import GenericService
+from .supervisor import ProcessRecord, Supervisor, format_stats, terminate_tree
 
 FLASK = {
     'api': {
@@ -49,9 +43,22 @@ class APIService(GenericService):
         self.is_test = kwargs.get("test", False)
         self.upload_sample = kwargs.get("sample_data", False)
         self.upload_scrape = kwargs.get("scrape_data", False)
+        self.bulk = kwargs.get("bulk", False)
+        self.mirror_media = kwargs.get("mirror_media", False)
         self.ngrok = kwargs.get("ngrok", False)
+        self.workers = kwargs.get("workers", 8)
+        self.offline = kwargs.get("offline", False)
+        self.per_page = kwargs.get("per_page", 20)
+        self.max_posts = kwargs.get("max_posts", None)
+        self.supervise = kwargs.get("supervise", False)
+        self.metrics_json = kwargs.get("metrics_json", None)
+        self.flask_record = ProcessRecord(self.log, 'PID')
+        self.log_file = None
+        self.pump = None
+        self.ngrok_record = ProcessRecord(self.log, 'NGROK_PID')
 
     def _validate_path(self, path):
+        from git import Repo
         try:
             repo = Repo(path)
             full_url = repo.remotes.origin.url
@@ -66,7 +73,7 @@ class APIService(GenericService):
             raise click.Abort()
 
     def _get_path(self):
-        env = os.environ.get('API_DIR', None)
+        env = path = os.environ.get('API_DIR', None)
         if env is None:
             path_config = self.log.retrieve('PATH', 'API_DIR')
             if path_config is not None:
@@ -89,18 +96,12 @@ class APIService(GenericService):
 
     def _is_running(self, conf_id='PID'):
         """checks if api is running"""
-        try:
-            last_pid = int(self.log.retrieve('API', conf_id))
-            return last_pid if psutil.pid_exists(last_pid) is True else False
-        except:
-            return False
-
-    def _output_flask(self, proc):
-        for l in iter(proc.stdout.readline, b''):
-            print(l.decode('utf-8'), end='')
+        proc = ProcessRecord(self.log, conf_id).process()
+        return proc.pid if proc is not None else False
 
     def start(self):
         """starts wbapi flask service"""
+        from . import ready
         if self._is_running():
             return self.log.warn(f"$[{self.name}] is already $w[running!]")
         self.path = self._get_path()
@@ -111,61 +112,110 @@ class APIService(GenericService):
             env_val = self.data['env'][evar]
             self.log.info(
                 f"$[{evar}] \u279C $w[{'...' + env_val[20:] if len(env_val) > 20 else env_val}]")
-        args = self.data['args']
-        args = args + f" -p {self.data['port']}"
-        out = subp.DEVNULL
-        if self.debug:
-            out = subp.PIPE
-        try:
-            with ch_dir(self.path):
-                flask_proc = psutil.Popen(args, stdout=out, stderr=subp.STDOUT, cwd=str(
-                    self.path), shell=True, env=dict(os.environ, **self.data['env']))
-        except FileNotFoundError:
-            return self.log.error(f"This service requires the $[Flask] python microframework.")
-        outp = None
-        if self.debug:
-            outp = threading.Thread(
-                target=self._output_flask, args=(flask_proc, ))
+        started = time.monotonic()
+        flask_proc = self._spawn_flask()
+        if flask_proc is None:
+            return
         self.log.info(f"API started on port $[{self.data['port']}]")
-        self.log.save('API', 'PID', str(flask_proc.pid))
+        self.flask_record.save(flask_proc)
+        services = ['api']
         if not self.is_test and not self.live:
-            try:
-                self.setup_resources()
-            except ClientError:
-                self.log.warn("Resources already exist!")
+            services.extend(['db', 's3'])
+        try:
+            ready.wait_all(services, self.log, since=started,
+                           procs={'api': flask_proc})
+        except ready.NotReady:
+            terminate_tree(flask_proc)
+            self.flask_record.clear()
+            raise click.Abort()
+        if not self.is_test and not self.live:
+            from . import resource as res
+            from . import scrape
+            self.setup_resources()
             if self.upload_sample:
                 self.log.info("Uploading sample data...")
-                res.upload_sample_data(self.log)
+                if self.bulk:
+                    res.bulk_load_sample_data(self.log)
+                else:
+                    res.upload_sample_data(self.log)
             if self.upload_scrape:
                 self.log.info("Scraping and Uploading data...")
-                scrape.upload_scraped_data(self.log)
+                scrape.upload_scraped_data(
+                    self.log, workers=self.workers, offline=self.offline,
+                    page_size=self.per_page, limit=self.max_posts,
+                    mirror_media=self.mirror_media)
+            self.report_metrics()
         self.log.info(f'$[{self.name}] is $w[live!]\n')
         # Handle Ngrok
         if self.ngrok:
             self.create_ngrok()
-        if outp is not None:
-            outp.start()
         return flask_proc
 
+    def attach(self):
+        """stays attached to flask when supervising or echoing its output"""
+        if self.supervise and self._is_running():
+            self.run_supervisor()
+        elif self.pump is not None:
+            self.pump.join()
+        if self.pump is not None and self.pump.dropped:
+            path = logs.log_file(self.log.config_path, self.id)
+            self.log.warn(
+                f"$w[{self.pump.dropped}] lines were too fast to echo, see $[{path}]")
+
+    def _spawn_flask(self):
+        """launches the flask process with its output drained into the log"""
+        args = self.data['args']
+        args = args + f" -p {self.data['port']}"
+        try:
+            with ch_dir(self.path):
+                flask_proc = psutil.Popen(args, stdout=subp.PIPE, stderr=subp.STDOUT, cwd=str(
+                    self.path), shell=True, env=dict(os.environ, **self.data['env']))
+        except FileNotFoundError:
+            self.log.error(
+                f"This service requires the $[Flask] python microframework.")
+            return None
+        self._attach_logs(flask_proc)
+        return flask_proc
+
+    def _attach_logs(self, flask_proc):
+        """pumps flask output in process when attached, else in a detached pump"""
+        path = logs.log_file(self.log.config_path, self.id)
+        if not (self.debug or self.supervise):
+            logs.spawn_pump(flask_proc.stdout, path)
+            return
+        if self.log_file is None:
+            self.log_file = logs.RotatingLog(path)
+        self.pump = logs.LogPump(
+            flask_proc.stdout, self.log_file, echo=self.debug).start()
+
+    def run_supervisor(self):
+        """restarts flask and ngrok if they crash until interrupted"""
+        supervisor = Supervisor(self.log)
+        supervisor.watch('flask', self.flask_record, self._spawn_flask)
+        if self.ngrok:
+            supervisor.watch('ngrok', self.ngrok_record, self._spawn_ngrok)
+        supervisor.run()
+        if self._is_running():
+            self.stop()
+
+    def report_metrics(self):
+        """summarizes outbound requests made while uploading data"""
+        from .session import sessions
+        sessions.metrics.report(self.log)
+        if self.metrics_json:
+            sessions.metrics.export(self.metrics_json)
+            self.log.info(f"Request metrics saved to $[{self.metrics_json}]")
+
     def setup_resources(self):
         """creates database tables and buckets"""
+        from . import resource as res
         self.log.info("Creating resources...")
-        dbclient = boto3.resource(
-            'dynamodb', region_name='localhost', endpoint_url='http://localhost:8000')
-        s3client = boto3.client('s3', region_name='localhost',
-                                endpoint_url='http://localhost:9000',
-                                aws_access_key_id='accessKey1', aws_secret_access_key='verySecretKey1')
-        s3resource = boto3.resource(
-            's3', region_name='localhost', endpoint_url='http://localhost:9000', aws_access_key_id='accessKey1', aws_secret_access_key='verySecretKey1')
-        self.resources = {}
-        self.resources['tables'] = [res.create_table(
-            dbclient, res.TABLES[t], self.log) for t in res.TABLES]
-        self.resources['buckets'] = [res.create_bucket(
-            s3client, s3resource, res.BUCKETS[b], self.log) for b in res.BUCKETS]
+        self.resources = res.setup_resources(self.log)
         return self.resources
 
     def get_ngrok_config(self):
         """retrieves/creates ngrok config"""
+        import yaml
         self.log.info("Fetching $[ngrok] config...")
         saved_config = self.log.retrieve("API", "NGROK_CONFIG")
         if saved_config:
@@ -193,6 +243,7 @@ class APIService(GenericService):
 
     def retrieve_ngrok_tunnel(self):
         """retrieves public ngrok tunnel url"""
+        import requests
         tunnel_endpoint = "http://localhost:4040/api/tunnels"
         retr = requests.get(tunnel_endpoint).json()
         tunnel = retr['tunnels'][0]['public_url']
@@ -200,6 +251,7 @@ class APIService(GenericService):
 
     def create_ngrok(self):
         """creates ngrok tunnel for api"""
+        from . import ready
         if self._is_running(conf_id="NGROK_PID"):
             tunnel = self.retrieve_ngrok_tunnel()
             return self.log.info(f"$[ngrok] tunnel already running at \u279C $w[{tunnel}]")
@@ -207,21 +259,28 @@ class APIService(GenericService):
         self.log.info("Config loaded...")
         self.log.info(
             f"Starting $[ngrok] tunnel on port $w[{self.data['port']}]")
-        ngrok_proc = psutil.Popen(f"ngrok start -config {config} api", stdout=subp.DEVNULL,
-                                  stderr=subp.STDOUT, shell=True)
-        self.log.save('API', 'NGROK_PID', str(ngrok_proc.pid))
-        sleep(5)  # lazily giving ngrok time to start
-        tunnel = self.retrieve_ngrok_tunnel()
+        ngrok_proc = self._spawn_ngrok(config)
+        self.ngrok_record.save(ngrok_proc)
+        try:
+            tunnels = ready.wait_for('ngrok', self.log, proc=ngrok_proc)
+        except ready.NotReady:
+            return self.log.error("$[ngrok] tunnel failed to launch")
+        tunnel = tunnels[0]['public_url']
         self.log.info(f'$[ngrok] tunnel launched at \u279C $w[{tunnel}]')
 
+    def _spawn_ngrok(self, config=None):
+        """launches the ngrok process"""
+        config = config or self.log.retrieve("API", "NGROK_CONFIG")
+        return psutil.Popen(f"ngrok start -config {config} api", stdout=subp.DEVNULL,
+                            stderr=subp.STDOUT, shell=True)
+
     def kill_ngrok(self):
         """kills ngrok process if running"""
         pid = self._is_running(conf_id="NGROK_PID")
         if pid:
             self.log.info("Terminating ngrok tunnel...")
-            ngrok_proc = psutil.Process(pid)
-            ngrok_proc.terminate()
-            self.log.save("API", "NGROK_PID", "")
+            terminate_tree(psutil.Process(pid))
+            self.ngrok_record.clear()
             return self.log.info(f"$[ngrok] tunnel has been stopped!")
         return False
 
@@ -230,11 +289,11 @@ class APIService(GenericService):
         pid = self._is_running()
         if not pid:
             return self.log.error(f"{self.name} is not running!")
-        self.kill_ngrok()
-        self.log.info("Terminating flask process...")
-        flask_proc = psutil.Process(pid)
-        flask_proc.terminate()
-        self.log.save('API', 'PID', '')
+        with self.log.batch():
+            self.kill_ngrok()
+            self.log.info("Terminating flask process...")
+            terminate_tree(psutil.Process(pid))
+            self.flask_record.clear()
         return self.log.info(f'$[{self.name}] has been stopped!')
 
     def restart(self):
@@ -245,5 +304,8 @@ class APIService(GenericService):
 
     def status(self):
         status = [self.name]
-        status.append(True if self._is_running() is not False else False)
+        stats = self.flask_record.stats()
+        status.append(stats is not None)
+        if stats is not None:
+            status.extend(format_stats(stats))
         return status
@@ -3,6 +3,8 @@
     Manages WarriorBeatApp
 """
 
+from utils import ServiceLog
+
 from .service import GenericService
 
 NODE = {
@@ -24,10 +26,24 @@ class AppService(GenericService):
     """App Type Services"""
     SERVICES = NODE
 
-    def __init__(self, id, flags):
+    def __init__(self, id, flags=None, **kwargs):
         self.id = id
-        self.flags = flags
+        self.data = NODE[self.id]
+        self.name = self.data['name']
+        self.flags = flags or []
+        self.log = ServiceLog('App', 'green')
 
     def start(self):
         print(self.id, self.flags)
         return True
+
+    def stop(self):
+        """nothing is left running by start yet"""
+        return self.log.warn(f"$[{self.name}] is not running!")
+
+    def restart(self):
+        self.stop()
+        return self.start()
+
+    def status(self):
+        return [self.name, False]
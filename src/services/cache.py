@@ -0,0 +1,151 @@
+"""
+    services/cache.py
+    On-disk HTTP response cache for scraped data
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .session import sessions
+
+CACHE = {
+    'dir': 'cache',
+    'ttl': 60 * 60 * 24,
+    'max_bytes': 256 * 1024 * 1024,
+}
+
+
+class OfflineCacheMiss(Exception):
+    """Raised when a url is not cached while offline"""
+
+
+class ResponseCache:
+    """URL keyed response cache with revalidation and LRU eviction"""
+
+    def __init__(self, root, offline=False, **config):
+        self.config = dict(CACHE, **config)
+        self.path = root / self.config['dir']
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.path / 'index.json'
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.url_locks = {}
+        self.index = self._load_index()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+
+    def _load_index(self):
+        try:
+            return json.loads(self.index_file.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _key(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _url_lock(self, key):
+        with self.lock:
+            return self.url_locks.setdefault(key, threading.Lock())
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _build_response(self, url, meta):
+        resp = requests.Response()
+        resp.url = url
+        resp.status_code = meta['status']
+        resp.headers = CaseInsensitiveDict(meta['headers'])
+        resp.encoding = meta['encoding']
+        resp._content = (self.path / meta['key']).read_bytes()
+        return resp
+
+    def _store(self, url, key, resp):
+        body = resp.content
+        (self.path / key).write_bytes(body)
+        with self.lock:
+            self.index[url] = {
+                'key': key,
+                'status': resp.status_code,
+                'headers': dict(resp.headers),
+                'encoding': resp.encoding,
+                'size': len(body),
+                'stored': time.time(),
+                'accessed': time.time(),
+            }
+        self._evict()
+
+    def _evict(self):
+        """drops least recently used entries beyond max_bytes"""
+        with self.lock:
+            total = sum(m['size'] for m in self.index.values())
+            by_access = sorted(self.index.items(), key=lambda e: e[1]['accessed'])
+            for url, meta in by_access:
+                if total <= self.config['max_bytes']:
+                    break
+                total -= meta['size']
+                del self.index[url]
+                try:
+                    (self.path / meta['key']).unlink()
+                except OSError:
+                    pass
+
+    def _revalidation_headers(self, meta):
+        headers = {}
+        etag = meta['headers'].get('ETag')
+        modified = meta['headers'].get('Last-Modified')
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        return headers
+
+    def get(self, url):
+        """retrieves url from cache, revalidating stale entries"""
+        key = self._key(url)
+        with self._url_lock(key):
+            meta = self.index.get(url)
+            if meta and not (self.path / meta['key']).exists():
+                meta = None
+            if self.offline:
+                if meta is None:
+                    raise OfflineCacheMiss(f"{url} is not cached")
+                return self._hit(url, meta, 'hits')
+            if meta and time.time() - meta['stored'] < self.config['ttl']:
+                return self._hit(url, meta, 'hits')
+            headers = self._revalidation_headers(meta) if meta else {}
+            try:
+                resp = sessions.get(url, headers=headers)
+            except requests.ConnectionError:
+                if meta is None:
+                    raise
+                return self._hit(url, meta, 'hits')
+            if meta and resp.status_code == 304:
+                meta['stored'] = time.time()
+                return self._hit(url, meta, 'revalidated')
+            self._count('misses')
+            if resp.status_code == 200:
+                self._store(url, key, resp)
+            return resp
+
+    def _hit(self, url, meta, stat):
+        self._count(stat)
+        meta['accessed'] = time.time()
+        return self._build_response(url, meta)
+
+    def flush(self):
+        """atomically writes the cache index"""
+        with self.lock:
+            data = json.dumps(self.index)
+        tmp_file = self.index_file.with_suffix('.tmp')
+        tmp_file.write_text(data)
+        os.replace(str(tmp_file), str(self.index_file))
+
+    def report(self, logger):
+        logger.info(
+            f"HTTP cache \u279C hits $w[{self.stats['hits']}], revalidated $w[{self.stats['revalidated']}], misses $w[{self.stats['misses']}]")
@@ -3,12 +3,16 @@
     Manages Docker Containers used by WarriorBeat
 """
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import docker
 from docker.errors import ImageNotFound
 
 from utils import ServiceLog
 
+from . import images
 from .service import GenericService
 
 DOCKER = {
@@ -24,60 +28,148 @@ DOCKER = {
     },
 }
 
+PROFILE_LABEL = 'wbcli.profile'
+
+# container settings layered over DOCKER, selected with --perf-profile
+PROFILES = {
+    'default': {},
+    'fast': {
+        'db': {
+            'command': ['-Xms512m', '-Xmx2g', '-jar', 'DynamoDBLocal.jar', '-inMemory', '-sharedDb'],
+            'tmpfs': {'/tmp': 'rw,size=256m'},
+            'nano_cpus': 2 * 10 ** 9,
+            'mem_limit': '3g',
+        },
+        's3': {
+            'tmpfs': {'/tmp': 'rw,size=256m'},
+            'nano_cpus': 10 ** 9,
+            'mem_limit': '1g',
+        },
+    },
+    'persistent': {
+        'db': {
+            'command': ['-Xmx1g', '-jar', 'DynamoDBLocal.jar', '-sharedDb', '-dbPath', '/data'],
+            'volumes': {'dynamodb': {'bind': '/data', 'mode': 'rw'}},
+            'user': 'root',
+            'nano_cpus': 2 * 10 ** 9,
+            'mem_limit': '2g',
+        },
+        's3': {
+            'image': 'scality/s3server',
+            'volumes': {
+                's3/data': {'bind': '/usr/src/app/localData', 'mode': 'rw'},
+                's3/metadata': {'bind': '/usr/src/app/localMetadata', 'mode': 'rw'},
+            },
+            'nano_cpus': 10 ** 9,
+            'mem_limit': '1g',
+        },
+    },
+}
+
+
+def resolve_profile(container, requested=None):
+    """requested profile, else the one an existing container was created with"""
+    if requested:
+        return requested
+    if container is None:
+        return 'default'
+    return container.labels.get(PROFILE_LABEL, 'default')
+
+
+def container_spec(id, profile, config_path):
+    """DOCKER settings of id with profile applied, volumes bound under config_path"""
+    spec = dict(DOCKER[id], **PROFILES[profile].get(id, {}))
+    if 'volumes' in spec:
+        data_path = config_path / 'data'
+        spec['volumes'] = {str(data_path / host): bind
+                           for host, bind in spec['volumes'].items()}
+    spec['labels'] = {PROFILE_LABEL: profile}
+    return spec
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """process-wide docker client"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            client = docker.from_env()
+            client.ping()
+            _client = client
+        return _client
+
+
+def list_containers(names):
+    """fetches the named containers in a single call"""
+    containers = get_client().containers.list(
+        all=True, filters={'name': names})
+    return {c.name: c for c in containers if c.name in names}
+
 
 class DockerService(GenericService):
     """Management for docker related services"""
     SERVICES = DOCKER
 
-    def __init__(self, id, debug=False, live=False, **kwargs):
+    def __init__(self, id, debug=False, live=False, perf_profile=None, **kwargs):
         self.id = id
         self.live = live
         self.log = ServiceLog('Docker', 'cyan')
         self.client = self._get_client()
-        self.data = self.SERVICES[self.id]
+        self.container = self._get_container(self.SERVICES[self.id]['name'])
+        self.profile = resolve_profile(self.container, perf_profile)
+        self.data = container_spec(self.id, self.profile, self.log.config_path)
         self.name = self.data['name']
-        self.container = self._get_container()
 
     def _get_client(self):
-        """creates a docker client"""
-        client = docker.from_env()
+        """retrieves the shared docker client"""
         try:
-            client.ping()
-            return client
+            return get_client()
         except Exception as e:
             self.log.clear()
             self.log.exception(e)
             return self.log.error('The Docker Service is not Running.')
 
-    def _get_container(self):
+    def _get_container(self, name):
         """retrieve a docker container"""
-        client = self.client.containers
         try:
-            container = client.get(self.name)
+            container = self.client.containers.get(name)
             return container
         except:
             return None
 
-    def _create(self, image=None):
+    def _profile(self):
+        """performance profile the existing container was created with"""
+        return resolve_profile(self.container) if self.container else None
+
+    def _recreate(self):
+        """replaces a container created with a different profile"""
+        self.log.info(
+            f"$[{self.name}] uses profile $w[{self._profile()}], recreating as $w[{self.profile}]...")
+        self.container.remove(force=True)
+        self.container = self._create()
+
+    def _create(self):
         """creates container"""
+        if self.client is None:
+            return None
         client = self.client.containers
-        self.log.info(f"Container $[{self.name}] not found. Creating now...")
-        if image:
-            self.data['image'] = image
+        self.log.info(
+            f"Creating container $[{self.name}] with profile $w[{self.profile}]...")
+        for host in self.data.get('volumes', {}):
+            os.makedirs(host, exist_ok=True)
         try:
-            container = client.create(**self.data, detach=True)
+            return client.create(**self.data, detach=True)
         except ImageNotFound:
             self.log.info(
                 f"Image $[{self.data['image']}] not found, pulling from registry...")
-            img = self._get_image(self.data['image'])
-            return self._create(image=img)
-        return container
-
-    def _get_image(self, image):
-        """downloads container image"""
-        registry = self.client.images.get_registry_data(image)
-        image = registry.pull()
-        return image
+            results = images.pull_images(self.client, [self.data['image']], self.log)
+            if not results.get(self.data['image']):
+                self.log.error(f"Cannot create $[{self.name}] without its image")
+                return None
+        return client.create(**self.data, detach=True)
 
     def _is_running(self, container=None):
         """checks if a container is running"""
@@ -91,25 +183,33 @@ class DockerService(GenericService):
         """starts container"""
         if self.live:
             return self.log.warn(f"{self.name} cannot run in live mode.\n")
-        if self.container:
+        if self.client is None:
+            # _get_client already reported the daemon as down
+            return
+        if self.container and self._profile() != self.profile:
+            self._recreate()
+        elif self.container:
             self.log.info(
                 f"Found container $[{self.name}] $[({self.container.short_id})]")
         else:
             self.container = self._create()
+        if self.container is None:
+            return
         container_id = f"$[{self.name}] $[({self.container.short_id})]"
         if self._is_running():
             return self.log.warn(f"{container_id} is already $w[running!]\n")
         self.log.info(
             f"Starting {container_id} on ports $w[{self.data['ports']}]")
         self.container.start()
+        self.container.reload()
         self.log.info(f"{container_id} is $w[live!]\n")
 
     def stop(self):
         """stops container"""
         _is_not_running = f"$[{self.name}] is not running!"
-        _container_id = f"$[{self.name}] $[({self.container.short_id})]"
         if not self.container:
             return self.log.error(_is_not_running)
+        _container_id = f"$[{self.name}] $[({self.container.short_id})]"
         if not self._is_running():
             return self.log.error(_is_not_running)
         self.log.info(f'Found container {_container_id}, stopping...')
@@ -118,9 +218,9 @@ class DockerService(GenericService):
 
     def restart(self):
         """restarts container"""
-        _container_id = f"$[{self.name}] $[({self.container.short_id})]"
         if not self._is_running():
-            return self.log.error(f"{_container_id} is not running!")
+            return self.log.error(f"$[{self.name}] is not running!")
+        _container_id = f"$[{self.name}] $[({self.container.short_id})]"
         self.log.info(f"{_container_id} is restarting...")
         self.container.restart()
         self.log.info(f"{_container_id} is $w[live!]\n")
@@ -129,3 +229,65 @@ class DockerService(GenericService):
         status = [self.name]
         status.append(True if self._is_running() is not False else False)
         return status
+
+    def stats(self):
+        """cpu, memory, network and block io of a running container"""
+        if not self._is_running():
+            return [self.name, self._profile() or '-']
+        raw = self.container.stats(stream=False)
+        cpu, pre = raw['cpu_stats'], raw['precpu_stats']
+        cpu_delta = cpu['cpu_usage']['total_usage'] - pre['cpu_usage']['total_usage']
+        system_delta = cpu.get('system_cpu_usage', 0) - pre.get('system_cpu_usage', 0)
+        cpus = cpu.get('online_cpus') or len(cpu['cpu_usage'].get('percpu_usage') or [1])
+        mem = raw.get('memory_stats', {})
+        net = raw.get('networks', {}).values()
+        blkio = raw.get('blkio_stats', {}).get('io_service_bytes_recursive') or []
+
+        def mb(n):
+            return f"{n / 2 ** 20:.1f}MB"
+        return [self.name, self._profile(),
+                f"{100 * cpu_delta / system_delta * cpus if system_delta > 0 else 0:.1f}%",
+                f"{mb(mem.get('usage', 0))} / {mb(mem.get('limit', 0))}",
+                f"{mb(sum(n['rx_bytes'] for n in net))} / {mb(sum(n['tx_bytes'] for n in net))}",
+                f"{mb(sum(b['value'] for b in blkio if b['op'].lower() == 'read'))} / "
+                f"{mb(sum(b['value'] for b in blkio if b['op'].lower() == 'write'))}"]
+
+    @classmethod
+    def stats_all(cls, ids):
+        """resource usage of containers, sampled concurrently"""
+        try:
+            get_client()
+        except Exception:
+            ServiceLog('Docker', 'cyan').error('The Docker Service is not Running.')
+            return [[cls.SERVICES[id]['name']] for id in ids]
+        with ThreadPoolExecutor(max_workers=len(ids)) as pool:
+            return list(pool.map(lambda id: cls(id).stats(), ids))
+
+    @classmethod
+    def prepare_all(cls, ids, offline=False, save=False, perf_profile=None, refresh=False, **kwargs):
+        """pulls the images of all containers concurrently, only missing ones unless refresh"""
+        log = ServiceLog('Docker', 'cyan')
+        try:
+            client = get_client()
+        except Exception:
+            log.error('The Docker Service is not Running.')
+            return {id: None for id in ids}
+        containers = list_containers([cls.SERVICES[id]['name'] for id in ids])
+        wanted = {}
+        for id in ids:
+            profile = resolve_profile(containers.get(cls.SERVICES[id]['name']), perf_profile)
+            wanted[dict(cls.SERVICES[id], **PROFILES[profile].get(id, {}))['image']] = id
+        results = images.pull_images(client, list(wanted), log, offline=offline, save=save,
+                                     refresh=refresh)
+        return {wanted[image]: result for image, result in results.items()}
+
+    @classmethod
+    def status_all(cls, ids):
+        """status of all containers from one list call"""
+        names = [cls.SERVICES[id]['name'] for id in ids]
+        try:
+            containers = list_containers(names)
+        except Exception:
+            containers = {}
+        return [[name, name in containers and containers[name].status == 'running']
+                for name in names]
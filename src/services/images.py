@@ -0,0 +1,133 @@
+"""
+    services/images.py
+    Concurrent docker image pulls with progress and an offline tarball cache
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from docker.errors import APIError, ImageNotFound
+from docker.utils import parse_repository_tag
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from tqdm import tqdm
+
+IMAGES = {
+    'dir': 'images',
+    'workers': 4,
+}
+
+
+def tarball(cache_dir, image):
+    """tarball path of an image in the offline cache"""
+    return cache_dir / f"{image.replace('/', '_').replace(':', '_')}.tar"
+
+
+def local_digests(client, image):
+    """repo digests of the local image, None if it is not present"""
+    try:
+        attrs = client.images.get(image).attrs
+    except ImageNotFound:
+        return None
+    return {d.split('@')[-1] for d in attrs.get('RepoDigests', [])}
+
+
+class PullProgress:
+    """One progress bar per image, summed over its layers"""
+
+    def __init__(self, image, position):
+        self.layers = {}
+        self.lock = threading.Lock()
+        self.bar = tqdm(desc=image, total=0, position=position, unit='B',
+                        unit_scale=True, leave=True)
+
+    def update(self, event):
+        detail = event.get('progressDetail') or {}
+        status = event.get('status')
+        with self.lock:
+            if status == 'Downloading' and 'total' in detail:
+                self.layers[event['id']] = (detail.get('current', 0), detail['total'])
+            elif status == 'Download complete' and event.get('id') in self.layers:
+                total = self.layers[event['id']][1]
+                self.layers[event['id']] = (total, total)
+            else:
+                return
+            self.bar.total = sum(t for _, t in self.layers.values())
+            self.bar.n = sum(c for c, _ in self.layers.values())
+            self.bar.refresh()
+
+    def close(self):
+        self.bar.close()
+
+
+def load_tarball(client, path):
+    with path.open('rb') as f:
+        return client.images.load(f)
+
+
+def save_tarball(client, image, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_suffix('.tmp')
+    with tmp_file.open('wb') as f:
+        for chunk in client.images.get(image).save(named=True):
+            f.write(chunk)
+    tmp_file.replace(path)
+
+
+def pull_image(client, image, cache_dir, position=0, offline=False, save=False, refresh=True):
+    """pulls image unless its local digest matches the registry, returns what was done
+
+    without refresh a local image is used as is, without asking the registry
+    """
+    cached = tarball(cache_dir, image)
+    local = local_digests(client, image)
+    if local is not None and (offline or not refresh):
+        return 'present'
+    if offline:
+        if cached.exists():
+            load_tarball(client, cached)
+            return 'loaded from cache'
+        raise ImageNotFound(f"{image} is not available offline")
+    try:
+        remote = client.images.get_registry_data(image).id
+    except (APIError, RequestsConnectionError):
+        if local is not None:
+            return 'registry unreachable, using local'
+        if cached.exists():
+            load_tarball(client, cached)
+            return 'loaded from cache'
+        raise
+    if local and remote in local:
+        result = 'up to date'
+    else:
+        repo, tag = parse_repository_tag(image)
+        progress = PullProgress(image, position)
+        try:
+            for event in client.api.pull(repo, tag=tag or 'latest', stream=True, decode=True):
+                if 'error' in event:
+                    raise APIError(event['error'])
+                progress.update(event)
+        finally:
+            progress.close()
+        result = 'pulled'
+    if save and (result == 'pulled' or not cached.exists()):
+        save_tarball(client, image, cached)
+    return result
+
+
+def pull_images(client, images, log, offline=False, save=False, refresh=True):
+    """pulls images concurrently"""
+    cache_dir = log.config_path / IMAGES['dir']
+    with ThreadPoolExecutor(max_workers=IMAGES['workers']) as pool:
+        jobs = {image: pool.submit(pull_image, client, image, cache_dir, pos, offline, save, refresh)
+                for pos, image in enumerate(images)}
+        results = {}
+        for image, job in jobs.items():
+            try:
+                results[image] = job.result()
+            except Exception as e:
+                results[image] = None
+                log.error(f"Failed to get {image}: {e}")
+    for image, result in results.items():
+        if result:
+            log.info(f"$[{image}] \u279C $w[{result}]")
+    return results
@@ -0,0 +1,171 @@
+"""
+    services/logs.py
+    Non-blocking log capture for child processes
+
+    Run as `python -m services.logs <file>` to pump stdin into a rotating log
+"""
+
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+LOGS = {
+    'dir': 'logs',
+    'max_bytes': 5 * 1024 * 1024,
+    'backups': 3,
+    'echo_lines': 1000,
+}
+
+
+def log_file(config_path, name):
+    return config_path / LOGS['dir'] / f"{name}.log"
+
+
+class RotatingLog:
+    """Append-only log file rotated by size"""
+
+    def __init__(self, path, max_bytes=LOGS['max_bytes'], backups=LOGS['backups']):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock = threading.Lock()
+        self.file = self.path.open('ab')
+
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                os.replace(str(src), str(
+                    self.path.with_name(f"{self.path.name}.{i + 1}")))
+        os.replace(str(self.path), str(self.path.with_name(f"{self.path.name}.1")))
+        self.file = self.path.open('ab')
+
+    def write(self, line):
+        with self.lock:
+            if self.file.tell() + len(line) > self.max_bytes:
+                self._rotate()
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class LogPump:
+    """Drains a stream into a rotating log as soon as it is written"""
+
+    def __init__(self, stream, log, echo=False):
+        self.stream = stream
+        self.log = log
+        self.echo = queue.Queue(maxsize=LOGS['echo_lines']) if echo else None
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        if self.echo is not None:
+            threading.Thread(target=self._print, daemon=True).start()
+        return self
+
+    def _drain(self):
+        for line in iter(self.stream.readline, b''):
+            self.log.write(line)
+            if self.echo is not None:
+                try:
+                    self.echo.put_nowait(line)
+                except queue.Full:
+                    # a slow terminal drops echoed lines rather than stall the child
+                    self.dropped += 1
+        self.stream.close()
+
+    def _print(self):
+        while True:
+            line = self.echo.get()
+            print(line.decode('utf-8', 'replace'), end='', flush=True)
+
+    def join(self):
+        self.thread.join()
+
+
+def spawn_pump(stream, path):
+    """detached process pumping stream into path, outliving the cli"""
+    import subprocess as subp
+    src = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [src, os.environ.get('PYTHONPATH')])))
+    proc = subp.Popen([sys.executable, '-m', 'services.logs', str(path)], stdin=stream,
+                      stdout=subp.DEVNULL, stderr=subp.DEVNULL, env=env, start_new_session=True)
+    stream.close()
+    return proc
+
+
+def tail(path, n=10, block_size=4096):
+    """last n lines of a file, read backwards from the end"""
+    try:
+        with Path(path).open('rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = pos = f.tell()
+            data = b''
+            while pos > 0 and data.count(b'\n') <= n:
+                pos = max(pos - block_size, 0)
+                f.seek(pos)
+                data = f.read(end - pos)
+    except FileNotFoundError:
+        return []
+    return data.splitlines(keepends=True)[-n:] if n else []
+
+
+def _open(path, at_end=False):
+    try:
+        f = Path(path).open('rb')
+    except FileNotFoundError:
+        return None
+    if at_end:
+        f.seek(0, os.SEEK_END)
+    return f
+
+
+def _rotated(path, f):
+    try:
+        return Path(path).stat().st_ino != os.fstat(f.fileno()).st_ino
+    except FileNotFoundError:
+        return True
+
+
+def follow(path, interval=0.25):
+    """yields lines appended to path, reopening it when rotated"""
+    f = _open(path, at_end=True)
+    try:
+        while True:
+            if f is None:
+                time.sleep(interval)
+                f = _open(path)
+                continue
+            line = f.readline()
+            if line:
+                yield line
+            elif _rotated(path, f):
+                yield from f.readlines()
+                f.close()
+                f = _open(path)
+            else:
+                time.sleep(interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def main():
+    log = RotatingLog(sys.argv[1])
+    LogPump(sys.stdin.buffer, log).start().join()
+    log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+    services/mirror.py
+    Mirrors scraped media into the local S3 media bucket
+"""
+
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import requests
+from botocore.exceptions import ClientError
+
+from . import resource
+from .session import sessions
+
+MIRROR = {
+    'chunk_bytes': 64 * 1024,
+    # downloads larger than this spill to disk, bounding memory per worker
+    'spool_bytes': 2 * 1024 * 1024,
+    'multipart_threshold': 8 * 1024 * 1024,
+    'multipart_chunksize': 8 * 1024 * 1024,
+    'max_concurrency': 8,
+}
+
+
+@lru_cache(maxsize=None)
+def transfer_config():
+    """transfer settings shared by every upload"""
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=MIRROR['multipart_threshold'],
+                          multipart_chunksize=MIRROR['multipart_chunksize'],
+                          max_concurrency=MIRROR['max_concurrency'], use_threads=True)
+
+
+def extension(url, content_type):
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    if not ext and content_type:
+        ext = mimetypes.guess_extension(content_type.split(';')[0].strip()) or ''
+    return ext
+
+
+class MediaMirror:
+    """Downloads each image once and uploads each distinct content once"""
+
+    def __init__(self, logger, bucket=resource.BUCKETS['media']):
+        self.log = logger
+        self.client = resource.get_client('s3')
+        self.bucket = bucket['bucket_name']
+        self.prefix = bucket['parent_key']
+        self.base_url = resource.ENDPOINTS['s3']['endpoint_url'].rstrip('/')
+        self.lock = threading.Lock()
+        self.urls = {}
+        self.hashes = {}
+        self.stats = {'downloaded': 0, 'uploaded': 0, 'deduped': 0, 'failed': 0, 'bytes': 0}
+
+    def _count(self, stat, n=1):
+        with self.lock:
+            self.stats[stat] += n
+
+    def _once(self, table, key, factory):
+        """result of factory for key, computed by the first caller only, and if this was it"""
+        with self.lock:
+            entry = table.get(key)
+            owner = entry is None
+            if owner:
+                entry = table[key] = Future()
+        if owner:
+            try:
+                entry.set_result(factory())
+            except Exception as e:
+                entry.set_exception(e)
+        return entry.result(), owner
+
+    def _download(self, url):
+        """streams url into a spooled file, hashing it on the way"""
+        resp = sessions.get(url, stream=True)
+        resp.raise_for_status()
+        body = tempfile.SpooledTemporaryFile(max_size=MIRROR['spool_bytes'])
+        digest = hashlib.sha256()
+        with resp:
+            for chunk in resp.iter_content(MIRROR['chunk_bytes']):
+                digest.update(chunk)
+                body.write(chunk)
+        self._count('downloaded')
+        self._count('bytes', body.tell())
+        body.seek(0)
+        return body, digest.hexdigest(), resp.headers.get('Content-Type')
+
+    def _exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def _upload(self, key, body, content_type):
+        if self._exists(key):
+            self._count('deduped')
+            return key
+        extra = {'ACL': 'public-read'}
+        if content_type:
+            extra['ContentType'] = content_type
+        self.client.upload_fileobj(body, self.bucket, key, ExtraArgs=extra,
+                                   Config=transfer_config())
+        self._count('uploaded')
+        return key
+
+    def _mirror(self, url):
+        body, sha, content_type = self._download(url)
+        with body:
+            key = f"{self.prefix}{sha}{extension(url, content_type)}"
+            owner = self._once(self.hashes, key,
+                               lambda: self._upload(key, body, content_type))[1]
+        if not owner:
+            self._count('deduped')
+        return key
+
+    def mirror(self, url):
+        """local bucket key holding the content of url"""
+        return self._once(self.urls, url, lambda: self._mirror(url))[0]
+
+    def local_source(self, url):
+        """local url serving the content of url, or url if mirroring failed"""
+        try:
+            return f"{self.base_url}/{self.bucket}/{self.mirror(url)}"
+        except (requests.RequestException, ClientError) as e:
+            self._count('failed')
+            self.log.error(f"Failed to mirror {url}: {e}")
+            return url
+
+    def report(self):
+        stats = self.stats
+        self.log.info(
+            f"Media mirror \u279C downloaded $w[{stats['downloaded']}] ($w[{stats['bytes'] / 2 ** 20:.1f}MB]), "
+            f"uploaded $w[{stats['uploaded']}], deduped $w[{stats['deduped']}], failed $w[{stats['failed']}]")
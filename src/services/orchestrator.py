@@ -0,0 +1,121 @@
+"""
+    services/orchestrator.py
+    Starts and stops services in dependency order
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from tabulate import tabulate
+
+from utils import ServiceLog
+
+from . import ready, registry
+
+
+class DependencyFailed(Exception):
+    """Raised when a service cannot start because a dependency did not"""
+
+
+def levels(ids):
+    """groups ids into levels where each only depends on earlier ones"""
+    pending = {id: {d for d in registry.depends(id) if d in ids} for id in ids}
+    result = []
+    while pending:
+        level = [id for id, deps in pending.items() if not deps]
+        assert level, f"circular dependency between {', '.join(pending)}"
+        result.append(level)
+        for id in level:
+            del pending[id]
+        for deps in pending.values():
+            deps.difference_update(level)
+    return result
+
+
+class Orchestrator:
+    """Runs services in parallel, gating each on the readiness of its dependencies"""
+
+    def __init__(self, ids, factory, *args, **kwargs):
+        self.log = ServiceLog('Orchestrator', 'bright_blue')
+        self.levels = levels(list(ids))
+        self.order = [id for level in self.levels for id in level]
+        self.services = {id: factory(id, *args, **kwargs) for id in self.order}
+        self.timeline = {}
+
+    def _launch(self, id, action, gates, origin):
+        """waits on the dependencies of id, then runs action until id is ready"""
+        waiting = time.monotonic()
+        for dep in registry.depends(id):
+            if dep not in gates:
+                continue
+            if gates[dep].exception() is not None:
+                raise DependencyFailed(f"{dep} did not {action}")
+            # live dependencies run remotely, so they are never running here
+            if not gates[dep].result() and not getattr(self.services[dep].service, 'live', False):
+                raise DependencyFailed(f"{dep} is not running")
+        began = time.monotonic()
+        service = self.services[id].service
+        getattr(service, action)()
+        running = service.status()[1]
+        if running and id in ready.READINESS:
+            ready.wait_for(id, self.log)
+        self.timeline[id] = (waiting - origin, began - origin,
+                             time.monotonic() - origin, running)
+        return running
+
+    def _run(self, action):
+        origin = time.monotonic()
+        gates = {}
+        with ThreadPoolExecutor(max_workers=len(self.order)) as pool:
+            # dependencies are submitted first, so their gates always exist
+            for id in self.order:
+                gates[id] = pool.submit(self._launch, id, action, gates, origin)
+            failed = []
+            for id, gate in gates.items():
+                try:
+                    gate.result()
+                except Exception as e:
+                    failed.append(id)
+                    self.log.error(f"{id} failed to {action}: {str(e) or type(e).__name__}")
+        self.report(time.monotonic() - origin)
+        if not failed:
+            for id in self.order:
+                self.services[id].service.attach()
+        return failed
+
+    def start(self):
+        """starts every service as soon as its dependencies are ready"""
+        return self._run('start')
+
+    def restart(self):
+        """restarts every service as soon as its dependencies are ready"""
+        return self._run('restart')
+
+    def stop(self):
+        """stops dependents before their dependencies"""
+        failed = []
+        for level in reversed(self.levels):
+            with ThreadPoolExecutor(max_workers=len(level)) as pool:
+                jobs = [(id, pool.submit(self.services[id].stop)) for id in level]
+            for id, job in jobs:
+                if job.exception() is not None:
+                    failed.append(id)
+                    self.log.error(f"{id} failed to stop: {job.exception()}")
+        return failed
+
+    def report(self, total, width=30):
+        """timeline of when each service started and became ready"""
+        rows = []
+        for id in self.order:
+            if id not in self.timeline:
+                rows.append([id, '-', '-', '-', ''])
+                continue
+            waiting, began, done, running = self.timeline[id]
+            start, end = (int(width * t / (total or 1)) for t in (began, done))
+            bar = '\u00b7' * start + '\u2588' * max(end - start, 1)
+            rows.append([id, f"{began - waiting:.2f}s", f"{began:.2f}s",
+                         f"{done:.2f}s" if running else 'not running', bar])
+        click.echo(tabulate(rows, headers=['Service', 'Waited', 'Started', 'Ready', 'Timeline'],
+                            tablefmt="fancy_grid"))
+        self.log.info(f"All services done in $w[{total:.2f}s]\n")
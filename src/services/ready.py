@@ -0,0 +1,95 @@
+"""
+    services/ready.py
+    Readiness probes for the local services
+"""
+
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+READINESS = {
+    # docker accepts on published ports before the container listens, so
+    # containers are only ready once they answer http
+    'db': {'http': 'http://localhost:8000', 'timeout': 30},
+    's3': {'http': 'http://localhost:9000', 'timeout': 30},
+    'api': {'port': 5000, 'timeout': 60},
+    'ngrok': {'url': 'http://localhost:4040/api/tunnels', 'timeout': 15},
+}
+
+
+class NotReady(Exception):
+    """Raised when a service does not become ready in time"""
+
+
+def port_open(port, host='localhost'):
+    """checks if a tcp port accepts connections"""
+    try:
+        with socket.create_connection((host, port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def http_responds(url):
+    """checks if url answers with any http response"""
+    try:
+        requests.get(url, timeout=1)
+        return True
+    except requests.RequestException:
+        return False
+
+
+def tunnels_up(url):
+    """retrieves active ngrok tunnels, if any"""
+    try:
+        return requests.get(url, timeout=1).json()['tunnels'] or None
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+
+def poll(check, timeout, delay=0.05, factor=2, max_delay=1.0):
+    """calls check with exponential backoff until it returns a truthy value"""
+    start = time.monotonic()
+    while True:
+        result = check()
+        elapsed = time.monotonic() - start
+        if result:
+            return result, elapsed
+        if elapsed + delay > timeout:
+            raise NotReady(f"is not ready after {elapsed:.1f}s")
+        time.sleep(delay)
+        delay = min(delay * factor, max_delay)
+
+
+def wait_for(service, logger, since=None, proc=None):
+    """blocks until service is ready, logging the start-to-ready latency"""
+    spec = READINESS[service]
+
+    def check():
+        if proc is not None and proc.poll() is not None:
+            raise NotReady(f"exited with code {proc.returncode}")
+        if 'port' in spec:
+            return port_open(spec['port'])
+        if 'http' in spec:
+            return http_responds(spec['http'])
+        return tunnels_up(spec['url'])
+    try:
+        result, elapsed = poll(check, spec['timeout'])
+    except NotReady as e:
+        logger.error(f"{service} {e}")
+        raise
+    if since is not None:
+        elapsed = time.monotonic() - since
+    logger.info(f"$[{service}] ready in $w[{elapsed * 1000:.0f}ms]")
+    return result
+
+
+def wait_all(services, logger, since=None, procs=None):
+    """waits on several services in parallel"""
+    procs = procs or {}
+    with ThreadPoolExecutor(max_workers=len(services)) as pool:
+        jobs = [pool.submit(wait_for, s, logger, since, procs.get(s))
+                for s in services]
+        return [j.result() for j in jobs]
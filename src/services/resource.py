@@ -3,11 +3,41 @@
     Resource management for API
 """
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
 from pathlib import Path
 
-import requests
+import boto3
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import BotoCoreError, ClientError
+
+from .session import sessions
 
 post_url = "http://127.0.0.1:5000/api/posts"
+sample_file = Path(__file__).parent.resolve() / 'sample.json'
+
+ENDPOINTS = {
+    'dynamodb': {
+        'region_name': 'localhost',
+        'endpoint_url': 'http://localhost:8000'
+    },
+    's3': {
+        'region_name': 'localhost',
+        'endpoint_url': 'http://localhost:9000',
+        'aws_access_key_id': 'accessKey1',
+        'aws_secret_access_key': 'verySecretKey1'
+    }
+}
+
+EXISTS_ERRORS = ('ResourceInUseException',
+                 'BucketAlreadyOwnedByYou', 'BucketAlreadyExists')
+WAITER_CONFIG = {'Delay': 1, 'MaxAttempts': 30}
+STATE_FILE = 'resources.json'
+
+BATCH_SIZE = 25
+BATCH_ATTEMPTS = 8
 
 TABLES = {
     'author': {
@@ -48,6 +78,12 @@ BUCKETS = {
 }
 
 
+@lru_cache(maxsize=None)
+def get_client(service):
+    """cached boto3 client for a local aws stand-in"""
+    return boto3.client(service, **ENDPOINTS[service])
+
+
 def create_table(client, table, logger):
     """Create dynamodb tables"""
     new_table = client.create_table(
@@ -68,29 +104,192 @@ def create_table(client, table, logger):
             'ReadCapacityUnits': 10,
             'WriteCapacityUnits': 10
         }
-    )
+    )['TableDescription']
     logger.info(
-        f"$[{table['table_name']}] \u279C $w[{new_table.table_status}]")
-    return new_table
+        f"$[{table['table_name']}] \u279C $w[{new_table['TableStatus']}]")
+    client.get_waiter('table_exists').wait(
+        TableName=table['table_name'], WaiterConfig=WAITER_CONFIG)
+    return table['table_name']
 
 
-def create_bucket(client, resource, bucket, logger):
+def create_bucket(client, bucket, logger):
     """create s3 bucket resource"""
     logger.info(f'Creating Bucket: $[{bucket["bucket_name"]}]')
-    _bucket = client.create_bucket(
-        Bucket=bucket['bucket_name'], ACL='public-read')
-    new_bucket = resource.Bucket(bucket['bucket_name'])
+    client.create_bucket(Bucket=bucket['bucket_name'], ACL='public-read')
+    client.get_waiter('bucket_exists').wait(
+        Bucket=bucket['bucket_name'], WaiterConfig=WAITER_CONFIG)
     logger.info(f"$[{bucket['bucket_name']}] \u279C $w[ACTIVE]")
-    return new_bucket
+    return bucket['bucket_name']
+
+
+def provision(create, client, spec, name, logger):
+    """creates a single resource, skipping it if it already exists"""
+    try:
+        return create(client, spec, logger)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in EXISTS_ERRORS:
+            logger.info(f"$[{name}] \u279C $w[EXISTS]")
+            return name
+        logger.error(f"Failed to create {name}: {code}")
+        return None
+    except BotoCoreError as e:
+        # waiter timeouts and connection failures only lose this resource
+        logger.error(f"Failed to create {name}: {e}")
+        return None
+
+
+def list_tables(client):
+    """names of all existing tables"""
+    names, kwargs = [], {}
+    while True:
+        resp = client.list_tables(**kwargs)
+        names.extend(resp['TableNames'])
+        if 'LastEvaluatedTableName' not in resp:
+            return names
+        kwargs['ExclusiveStartTableName'] = resp['LastEvaluatedTableName']
+
+
+def list_buckets(client):
+    """names of all existing buckets"""
+    return [b['Name'] for b in client.list_buckets()['Buckets']]
+
+
+def load_state(state_file):
+    try:
+        return json.loads(state_file.read_text())
+    except (OSError, ValueError):
+        return {'tables': [], 'buckets': []}
+
+
+def save_state(state_file, state):
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = state_file.with_suffix('.tmp')
+    tmp_file.write_text(json.dumps(state, indent=2))
+    tmp_file.replace(state_file)
+
+
+def setup_resources(logger, workers=8):
+    """reconciles tables and buckets, creating only what is missing"""
+    dbclient, s3client = get_client('dynamodb'), get_client('s3')
+    state_file = logger.config_path / STATE_FILE
+    last_state = load_state(state_file)
+    existing = {
+        'tables': list_tables(dbclient),
+        'buckets': list_buckets(s3client)
+    }
+    for kind in existing:
+        for name in set(last_state.get(kind, [])) - set(existing[kind]):
+            logger.warn(f"$[{name}] has disappeared since the last start")
+    tables = [t for t in TABLES.values()
+              if t['table_name'] not in existing['tables']]
+    buckets = [b for b in BUCKETS.values()
+               if b['bucket_name'] not in existing['buckets']]
+    if not tables and not buckets:
+        logger.info("All resources $w[up to date]")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tables = [pool.submit(provision, create_table, dbclient, t, t['table_name'], logger)
+                  for t in tables]
+        buckets = [pool.submit(provision, create_bucket, s3client, b, b['bucket_name'], logger)
+                   for b in buckets]
+        created = {
+            'tables': [t.result() for t in tables],
+            'buckets': [b.result() for b in buckets]
+        }
+    state = {kind: sorted(set(existing[kind]) | {n for n in created[kind] if n})
+             for kind in existing}
+    save_state(state_file, state)
+    return state
 
 
 def upload_sample_data(logger):
     """uploads sample post data to api"""
-    current_file = Path(__file__).parent.resolve()
-    sample_file = current_file / 'sample.json'
     logger.info(f"Loading sample data from $[{sample_file.name}]")
     sample_posts = json.load(sample_file.open(mode='r'))
     for p in sample_posts:
         logger.info(f"Uploading $[Post] \u279C $w[{p['title']}]")
-        req = requests.post(post_url, json=p)
+        req = sessions.post(post_url, json=p)
+    sessions.report(logger)
     return sample_posts
+
+
+def normalize_posts(posts):
+    """splits nested sample posts into records per table"""
+    records = {'post': [], 'author': [], 'media': [], 'category': []}
+    for p in posts:
+        post = dict(p)
+        author = post.get('author')
+        if isinstance(author, dict):
+            author = dict(author)
+            image = author.get('profile_image')
+            if isinstance(image, dict):
+                records['media'].append(image)
+                author['profile_image'] = image['mediaId']
+            records['author'].append(author)
+            post['author'] = author['authorId']
+        cover = post.get('cover_image')
+        if isinstance(cover, dict):
+            records['media'].append(cover)
+            post['cover_image'] = cover['mediaId']
+        categories = [c for c in post.get('categories', []) if isinstance(c, dict)]
+        records['category'].extend(categories)
+        post['categories'] = [c['categoryId'] if isinstance(c, dict) else c
+                              for c in post.get('categories', [])]
+        records['post'].append(post)
+    return records
+
+
+def load_fixture(path):
+    """loads a fixture file as records keyed by table"""
+    data = json.loads(Path(path).read_text(), parse_float=Decimal)
+    if isinstance(data, list):
+        return normalize_posts(data)
+    return data
+
+
+def write_batches(client, table, items, logger):
+    """writes items to a table in batches, retrying unprocessed items"""
+    serializer = TypeSerializer()
+    key = table['primary_key']
+    unique = {str(i[key]): i for i in items}
+    puts = [{'PutRequest': {'Item': {k: serializer.serialize(v) for k, v in i.items()}}}
+            for i in unique.values()]
+    write_requests(client, table['table_name'], puts)
+    logger.info(f"$[{table['table_name']}] \u279C $w[{len(puts)} items]")
+    return len(puts)
+
+
+def write_requests(client, table_name, puts):
+    """batch writes serialized put requests, retrying unprocessed items"""
+    for start in range(0, len(puts), BATCH_SIZE):
+        pending = {table_name: puts[start:start + BATCH_SIZE]}
+        for attempt in range(BATCH_ATTEMPTS):
+            resp = client.batch_write_item(RequestItems=pending)
+            pending = resp.get('UnprocessedItems')
+            if not pending:
+                break
+            time.sleep(min(0.05 * 2 ** attempt, 2))
+        else:
+            raise RuntimeError(
+                f"{table_name}: unprocessed items after {BATCH_ATTEMPTS} attempts")
+    return len(puts)
+
+
+def bulk_load(records, logger, workers=4):
+    """writes records directly to the local dynamodb tables in parallel"""
+    client = get_client('dynamodb')
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(write_batches, client, TABLES[t], items, logger)
+                for t, items in records.items() if items]
+        written = sum(j.result() for j in jobs)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Bulk loaded $[{written}] items in $w[{elapsed:.2f}s] ($w[{written / max(elapsed, 1e-6):.0f}] items/sec)")
+    return written
+
+
+def bulk_load_sample_data(logger, path=sample_file):
+    """bulk loads a fixture file without going through the api"""
+    logger.info(f"Bulk loading data from $[{Path(path).name}]")
+    return bulk_load(load_fixture(path), logger)
@@ -1,10 +1,21 @@
 import requests
 import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import wraps
 from pprint import pprint
 from random import sample, choice as rchoice, shuffle
 from bs4 import BeautifulSoup
 
+from utils import timed
+
+from .cache import OfflineCacheMiss, ResponseCache
+from .session import sessions
+
 base_url = 'https://ogwarriorbeat.com/wp-json/wp/v2'
+staff_url = 'https://ogwarriorbeat.com/staff/'
 local_url = "http://localhost:5000/api/"
 
 roles = [
@@ -24,13 +35,81 @@ default_desc = "Deep Patel is a senior at Oak Grove High School and is a first y
 user_desc = None
 user_media = None
 random_ids = None
+id_lock = threading.Lock()
+
+# Pipeline
+max_workers = 8
+per_page = 20
+max_posts = None
+timings = {}
+progress = {'done': 0, 'total': 0}
+progress_lock = threading.Lock()
 
 # Logger
 log = None
 
+# Response Cache
+http_cache = None
+
+# Media Mirror
+mirror = None
+
+
+class RunCache:
+    """Per-run identity cache of uploaded records"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.stats = {}
+
+    def fetch(self, kind, key, factory):
+        """returns the cached record, building it exactly once"""
+        with self.lock:
+            entry = self.entries.get((kind, key))
+            hit = entry is not None
+            if not hit:
+                entry = self.entries[(kind, key)] = Future()
+            counts = self.stats.setdefault(kind, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+        if not hit:
+            try:
+                entry.set_result(factory())
+            except Exception as e:
+                entry.set_exception(e)
+        return entry.result()
+
+    def report(self, logger):
+        for kind, counts in self.stats.items():
+            logger.info(
+                f"$[{kind}] cache \u279C hits $w[{counts['hits']}], misses $w[{counts['misses']}]")
+
+
+cache = RunCache()
+
+
+def memoized(kind):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(key, *args):
+            return cache.fetch(kind, key, lambda: func(key, *args))
+        return wrapper
+    return decorator
+
+
+def pool_map(func, items):
+    if max_workers <= 1:
+        return list(map(func, items))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(func, items))
+
+
+def fetch(url):
+    return (http_cache or sessions).get(url)
+
 
 def scrape_media():
-    page = requests.get('https://ogwarriorbeat.com/staff/').text
+    page = fetch(staff_url).text
     soup = BeautifulSoup(page, 'html.parser')
     media = []
     for l in soup.find_all('img'):
@@ -46,17 +125,18 @@ def scrape_media():
 
 
 def scrape_desc():
-    page = requests.get('https://ogwarriorbeat.com/staff/').text
+    page = fetch(staff_url).text
     soup = BeautifulSoup(page, 'html.parser')
     anchors = soup.find_all('a')
     desc_refs = [i.get('href') for i in anchors if "?writer=" in i.get('href')]
-    desc = []
-    for ref in desc_refs:
-        page = requests.get(ref).text
-        soup = BeautifulSoup(page, 'html.parser')
-        div = soup.find("div", "staffprofile")
-        desc.append(div.get_text())
-    return desc
+    return pool_map(scrape_profile, desc_refs)
+
+
+def scrape_profile(ref):
+    page = fetch(ref).text
+    soup = BeautifulSoup(page, 'html.parser')
+    div = soup.find("div", "staffprofile")
+    return div.get_text()
 
 
 def parse_render(text):
@@ -69,22 +149,26 @@ def get_desc(name):
     return desc
 
 
+@memoized('profile image')
 def get_profile_image(name):
     default = {
         'title': name,
         'source': default_media,
     }
-    profile = next((i for i in user_media if i['title'] == name), default)
-    medID = rchoice(random_ids)
-    random_ids.remove(medID)
+    profile = dict(next((i for i in user_media if i['title'] == name), default))
+    with id_lock:
+        medID = rchoice(random_ids)
+        random_ids.remove(medID)
     profile['mediaId'] = str(medID)
     profile['type'] = "profile-image"
-    requests.post(local_url + 'media', json=json.dumps(profile))
+    if mirror is not None:
+        profile['source'] = mirror.local_source(profile['source'])
+    sessions.post(local_url + 'media', json=json.dumps(profile))
     return profile
 
 
 def get_cover_image(id, title):
-    wp = requests.get(f"{base_url}/media/{id}").json()
+    wp = fetch(f"{base_url}/media/{id}").json()
     capt = wp['caption']['rendered']
     cover_image = {
         "mediaId": str(wp['id']),
@@ -93,12 +177,15 @@ def get_cover_image(id, title):
         "credits": "Photo Courtesy of John Adam",
         "caption": parse_render(capt) if len(capt) > 0 else "A Photo Caption"
     }
-    requests.post(local_url + 'media', json=json.dumps(cover_image))
+    if mirror is not None:
+        cover_image['source'] = mirror.local_source(cover_image['source'])
+    sessions.post(local_url + 'media', json=json.dumps(cover_image))
     return cover_image
 
 
+@memoized('author')
 def make_author(id):
-    wp = requests.get(f"{base_url}/users/{id}").json()
+    wp = fetch(f"{base_url}/users/{id}").json()
     author = {
         "authorId": str(id),
         "name": wp['name'],
@@ -109,12 +196,13 @@ def make_author(id):
         "staff_year": str(sample(range(1, 5), 1)[0])
     }
     author_data = json.dumps(author)
-    requests.post(local_url + 'authors', json=author_data)
+    sessions.post(local_url + 'authors', json=author_data)
     return author
 
 
+@memoized('category')
 def get_category(id):
-    wp = requests.get(f"{base_url}/categories/{id}").json()
+    wp = fetch(f"{base_url}/categories/{id}").json()
     if wp['id'] == 1 or wp['id'] == 2:
         return {}
     wp['id'] = 30 if wp['id'] == 34 else wp['id']
@@ -123,7 +211,7 @@ def get_category(id):
         "name": wp["name"]
     }
     cat_data = json.dumps(category)
-    requests.post(local_url + "categories", json=cat_data)
+    sessions.post(local_url + "categories", json=cat_data)
     return category
 
 
@@ -147,7 +235,7 @@ def make_post(wp):
 
 def create_post(post, prog):
     post = json.dumps(post)
-    req = requests.post(local_url + "posts", json=post)
+    req = sessions.post(local_url + "posts", json=post)
     try:
         req.raise_for_status()
     except requests.HTTPError as e:
@@ -160,20 +248,102 @@ def create_post(post, prog):
     return req
 
 
+def iter_wp_posts():
+    """walks the paginated posts endpoint, yielding posts as pages arrive"""
+    page = total_pages = 1
+    count = 0
+    page_size = min(per_page, max_posts) if max_posts else per_page
+    while page <= total_pages:
+        with timed('fetch pages', timings):
+            resp = fetch(f"{base_url}/posts?per_page={page_size}&page={page}")
+        total_pages = int(resp.headers.get('X-WP-TotalPages', 1))
+        total = int(resp.headers.get('X-WP-Total', 0))
+        progress['total'] = min(total, max_posts) if max_posts else total
+        for wp in resp.json():
+            count += 1
+            yield wp
+            if max_posts is not None and count >= max_posts:
+                return
+        page += 1
+
+
+def upload_post(wp):
+    with timed('build post (cumulative)', timings):
+        post = make_post(wp)
+    with progress_lock:
+        progress['done'] += 1
+        prog = (progress['done'], max(progress['total'], progress['done']))
+    with timed('upload post (cumulative)', timings):
+        create_post(post, prog)
+    timings.setdefault('first write', time.perf_counter() - progress['start'])
+    return post
+
+
+def stream_posts(wp_posts):
+    """builds and uploads posts as they stream in with bounded in-flight work"""
+    if max_workers <= 1:
+        yield from map(upload_post, wp_posts)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        for wp in wp_posts:
+            pending.append(pool.submit(upload_post, wp))
+            if len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
 def scrape_data():
-    wp_posts = requests.get(base_url + '/posts').json()
-    posts = list(map(make_post, wp_posts))
-    cur_req = 0
-    for p in posts:
-        cur_req += 1
-        create_post(p, (cur_req, len(posts)))
+    progress.update(done=0, total=0, start=time.perf_counter())
+    with timed('stream posts', timings):
+        uploaded = sum(1 for _ in stream_posts(iter_wp_posts()))
+    return uploaded
+
 
+def report_timings():
+    log.info(f"Scrape timings ($[{max_workers}] workers, cumulative stages sum every worker):")
+    for stage, elapsed in timings.items():
+        log.info(f"$[{stage}] \u279C $w[{elapsed:.2f}s]")
 
-def upload_scraped_data(logger=None):
-    global user_desc, user_media, random_ids, log
+
+def upload_scraped_data(logger=None, workers=8, offline=False, page_size=20, limit=None,
+                        mirror_media=False):
+    global log, timings, cache, http_cache, per_page, max_posts, mirror
     log = logger
-    user_media = scrape_media()
-    user_desc = scrape_desc()
-    random_ids = sample(range(4000, 5000), len(user_media) + 10)
-    shuffle(random_ids)
-    scrape_data()
+    per_page, max_posts = page_size, limit
+    timings = {}
+    cache = RunCache()
+    http_cache = ResponseCache(log.config_path, offline=offline)
+    mirror = None
+    if mirror_media and offline:
+        log.warn("Media is not mirrored offline, keeping remote sources")
+    elif mirror_media:
+        from .mirror import MediaMirror
+        mirror = MediaMirror(log)
+    try:
+        return scrape_all(workers)
+    except OfflineCacheMiss as e:
+        log.error(f"Offline scrape failed: {e}")
+    finally:
+        http_cache.flush()
+        http_cache.report(log)
+        if mirror is not None:
+            mirror.report()
+
+
+def scrape_all(workers):
+    global user_desc, user_media, random_ids, max_workers
+    max_workers = workers
+    with timed('total', timings):
+        with timed('scrape staff', timings):
+            user_media, user_desc = pool_map(
+                lambda scraper: scraper(), (scrape_media, scrape_desc))
+        random_ids = sample(range(4000, 5000), len(user_media) + 10)
+        shuffle(random_ids)
+        uploaded = scrape_data()
+    log.info(f"Uploaded $[{uploaded}] scraped posts")
+    report_timings()
+    cache.report(log)
+    sessions.report(log)
+    return uploaded
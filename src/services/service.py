@@ -24,6 +24,20 @@ class GenericService():
     def status(self):
         raise NotImplementedError()
 
+    def attach(self):
+        """blocks while a started service needs the cli, if it does"""
+        pass
+
     @classmethod
     def supports(cls, id):
         return True if id in cls.SERVICES else False
+
+    @classmethod
+    def status_all(cls, ids):
+        """status of several services of this provider"""
+        return [cls(id).status() for id in ids]
+
+    @classmethod
+    def prepare_all(cls, ids, **kwargs):
+        """fetches whatever several services need before starting, nothing by default"""
+        return {}
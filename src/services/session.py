@@ -0,0 +1,183 @@
+"""
+    services/session.py
+    Pooled HTTP sessions shared by the scrape and resource modules
+"""
+
+import json
+import math
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP = {
+    'timeout': (3.05, 30),
+    'pool_size': 16,
+    'retries': 3,
+    'backoff': 0.3,
+    'retry_status': (500, 502, 503, 504),
+}
+
+
+def endpoint_name(method, url):
+    """groups urls by host and path, with numeric ids collapsed"""
+    parts = urlsplit(url)
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', parts.path)
+    return f"{method} {parts.netloc}{path}"
+
+
+def percentile(values, pct):
+    """nearest-rank percentile of sorted values"""
+    if not values:
+        return 0
+    rank = max(math.ceil(pct / 100 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class RequestMetrics:
+    """Per-endpoint latency, size and error counts of outbound requests"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.first = self.last = None
+
+    def record(self, endpoint, started, elapsed, sent=0, received=0, error=False):
+        with self.lock:
+            stat = self.endpoints.setdefault(endpoint, {
+                'latency': [], 'sent': 0, 'received': 0, 'errors': 0})
+            stat['latency'].append(elapsed)
+            stat['sent'] += sent
+            stat['received'] += received
+            stat['errors'] += int(error)
+            self.first = started if self.first is None else min(self.first, started)
+            self.last = max(self.last or 0, started + elapsed)
+
+    def summary(self):
+        """aggregated stats per endpoint"""
+        with self.lock:
+            window = max((self.last or 0) - (self.first or 0), 1e-6)
+            rows = {}
+            for endpoint, stat in sorted(self.endpoints.items()):
+                latency = sorted(stat['latency'])
+                rows[endpoint] = {
+                    'requests': len(latency),
+                    'errors': stat['errors'],
+                    'p50_ms': percentile(latency, 50) * 1000,
+                    'p95_ms': percentile(latency, 95) * 1000,
+                    'p99_ms': percentile(latency, 99) * 1000,
+                    'bytes_sent': stat['sent'],
+                    'bytes_received': stat['received'],
+                    'requests_per_sec': len(latency) / window,
+                }
+            return rows
+
+    def report(self, logger):
+        from click import echo
+        from tabulate import tabulate
+        rows = [[endpoint, r['requests'], r['errors'], f"{r['p50_ms']:.0f}", f"{r['p95_ms']:.0f}",
+                 f"{r['p99_ms']:.0f}", f"{(r['bytes_sent'] + r['bytes_received']) / 1024:.1f}",
+                 f"{r['requests_per_sec']:.1f}"] for endpoint, r in self.summary().items()]
+        if not rows:
+            return
+        logger.info("Request metrics:")
+        echo(tabulate(rows, headers=['Endpoint', 'Requests', 'Errors', 'p50 ms', 'p95 ms',
+                                      'p99 ms', 'KB', 'req/s'], tablefmt="fancy_grid"))
+
+    def export(self, path):
+        with open(str(path), 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+class SessionPool:
+    """Keep-alive sessions, one connection pool per host"""
+
+    def __init__(self, **config):
+        self.config = dict(HTTP, **config)
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.metrics = RequestMetrics()
+
+    def _create_session(self):
+        """creates a session with a retrying, pooled adapter"""
+        retry = Retry(total=self.config['retries'],
+                      backoff_factor=self.config['backoff'],
+                      status_forcelist=self.config['retry_status'],
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=self.config['pool_size'], max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get_session(self, url):
+        """retrieves the session for the host of url"""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            if host not in self.sessions:
+                self.sessions[host] = self._create_session()
+            return self.sessions[host]
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.config['timeout'])
+        endpoint = endpoint_name(method, url)
+        started = time.perf_counter()
+        try:
+            resp = self.get_session(url).request(method, url, **kwargs)
+        except requests.RequestException:
+            self.metrics.record(endpoint, started, time.perf_counter() - started, error=True)
+            raise
+        # streamed bodies are left unread, so trust the declared length
+        received = (int(resp.headers.get('Content-Length', 0)) if kwargs.get('stream')
+                    else len(resp.content))
+        body = resp.request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.metrics.record(endpoint, started, time.perf_counter() - started,
+                            sent=len(body), received=received,
+                            error=resp.status_code >= 400)
+        return resp
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """connections opened vs reused per host"""
+        stats = {}
+        with self.lock:
+            sessions = dict(self.sessions)
+        for host, session in sessions.items():
+            pools = session.get_adapter(host).poolmanager.pools
+            opened = requests_made = 0
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                requests_made += pool.num_requests
+            stats[host] = {'opened': opened,
+                           'reused': max(requests_made - opened, 0)}
+        return stats
+
+    def report(self, logger):
+        for host, stat in self.stats().items():
+            logger.info(
+                f"$[{host}] connections \u279C opened $w[{stat['opened']}], reused $w[{stat['reused']}]")
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+
+sessions = SessionPool()
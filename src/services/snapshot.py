@@ -0,0 +1,204 @@
+"""
+    services/snapshot.py
+    Saves and restores local DynamoDB tables and S3 buckets
+
+    A snapshot is a gzipped JSON lines archive: a meta line, then one line per
+    table item (in DynamoDB attribute value form) or bucket object (base64).
+"""
+
+import base64
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import resource
+
+SNAPSHOT = {
+    'dir': 'snapshots',
+    'version': 1,
+    'segments': 4,
+    'workers': 8,
+    'chunk_items': 500,
+    'compresslevel': 6,
+}
+
+
+def snapshot_dir(config_path):
+    return config_path / SNAPSHOT['dir']
+
+
+def snapshot_file(config_path, name):
+    return snapshot_dir(config_path) / f"{name}.jsonl.gz"
+
+
+def list_snapshots(config_path):
+    """(name, size, modified) of saved snapshots"""
+    files = sorted(snapshot_dir(config_path).glob('*.jsonl.gz'))
+    return [(f.name[:-len('.jsonl.gz')], f.stat().st_size, f.stat().st_mtime) for f in files]
+
+
+class ArchiveWriter:
+    """Thread safe line writer over a gzip stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def write(self, record, count_as):
+        line = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self.lock:
+            self.stream.write(line)
+            self.counts[count_as] = self.counts.get(count_as, 0) + 1
+
+
+def scan_segment(client, table_name, segment, writer):
+    """scans one segment of a table page by page into the archive"""
+    kwargs = {'TableName': table_name, 'Segment': segment,
+              'TotalSegments': SNAPSHOT['segments']}
+    while True:
+        page = client.scan(**kwargs)
+        for item in page['Items']:
+            writer.write({'kind': 'item', 'table': table_name, 'item': item}, table_name)
+        if 'LastEvaluatedKey' not in page:
+            return
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def dump_object(client, bucket, key, writer):
+    obj = client.get_object(Bucket=bucket, Key=key)
+    writer.write({'kind': 'object', 'bucket': bucket, 'key': key,
+                  'content_type': obj.get('ContentType'),
+                  'body': base64.b64encode(obj['Body'].read()).decode('ascii')}, bucket)
+
+
+def list_keys(client, bucket):
+    pages = client.get_paginator('list_objects_v2').paginate(Bucket=bucket)
+    return [o['Key'] for page in pages for o in page.get('Contents', [])]
+
+
+def save(name, logger):
+    """dumps every table and bucket into a snapshot archive"""
+    dbclient, s3client = resource.get_client('dynamodb'), resource.get_client('s3')
+    tables = [t['table_name'] for t in resource.TABLES.values()]
+    buckets = [b['bucket_name'] for b in resource.BUCKETS.values()]
+    path = snapshot_file(logger.config_path, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f".{path.name}.tmp")
+    start = time.perf_counter()
+    try:
+        with gzip.open(str(tmp_file), 'wb', compresslevel=SNAPSHOT['compresslevel']) as stream:
+            writer = ArchiveWriter(stream)
+            writer.write({'kind': 'meta', 'version': SNAPSHOT['version'], 'created': time.time(),
+                          'tables': tables, 'buckets': buckets}, 'meta')
+            with ThreadPoolExecutor(max_workers=SNAPSHOT['workers']) as pool:
+                jobs = [pool.submit(scan_segment, dbclient, table, segment, writer)
+                        for table in tables for segment in range(SNAPSHOT['segments'])]
+                for bucket in buckets:
+                    jobs.extend(pool.submit(dump_object, s3client, bucket, key, writer)
+                                for key in list_keys(s3client, bucket))
+                for job in jobs:
+                    job.result()
+    except BaseException:
+        tmp_file.unlink()
+        raise
+    tmp_file.replace(path)
+    for resource_name in tables + buckets:
+        logger.info(f"$[{resource_name}] \u279C $w[{writer.counts.get(resource_name, 0)}]")
+    logger.info(
+        f"Saved snapshot $[{name}] ($w[{path.stat().st_size / 2 ** 20:.1f}MB]) in $w[{time.perf_counter() - start:.2f}s]")
+    return path
+
+
+def read_archive(path):
+    """meta record and a lazy iterator over the remaining records"""
+    stream = gzip.open(str(path), 'rb')
+    lines = (json.loads(line) for line in stream)
+    meta = next(lines, None)
+    if meta is None or meta.get('kind') != 'meta' or meta.get('version') != SNAPSHOT['version']:
+        stream.close()
+        raise ValueError(f"{path.name} is not a snapshot archive")
+    return meta, lines, stream
+
+
+def put_object(client, record):
+    extra = {'ContentType': record['content_type']} if record.get('content_type') else {}
+    client.put_object(Bucket=record['bucket'], Key=record['key'],
+                      Body=base64.b64decode(record['body']), **extra)
+
+
+def clear_table(client, table_name):
+    """deletes every item of a table, keeping the table itself"""
+    keys = [k['AttributeName'] for k in
+            client.describe_table(TableName=table_name)['Table']['KeySchema']]
+    names = {f"#k{i}": key for i, key in enumerate(keys)}
+    kwargs = {'TableName': table_name, 'ProjectionExpression': ', '.join(names),
+              'ExpressionAttributeNames': names}
+    deleted = 0
+    while True:
+        page = client.scan(**kwargs)
+        deleted += resource.write_requests(client, table_name, [
+            {'DeleteRequest': {'Key': item}} for item in page['Items']])
+        if 'LastEvaluatedKey' not in page:
+            return deleted
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def clear_bucket(client, bucket):
+    """deletes every object of a bucket, keeping the bucket itself"""
+    keys = list_keys(client, bucket)
+    for start in range(0, len(keys), 1000):
+        client.delete_objects(Bucket=bucket, Delete={
+            'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True})
+    return len(keys)
+
+
+def restore(name, logger):
+    """reconciles resources, empties them, then writes a snapshot back in parallel batches"""
+    path = snapshot_file(logger.config_path, name)
+    if not path.exists():
+        raise FileNotFoundError(f"No snapshot named {name}")
+    resource.setup_resources(logger)
+    dbclient, s3client = resource.get_client('dynamodb'), resource.get_client('s3')
+    meta, records, stream = read_archive(path)
+    start = time.perf_counter()
+    buffers, counts = {}, {}
+    in_flight = deque()
+    with stream, ThreadPoolExecutor(max_workers=SNAPSHOT['workers']) as pool:
+        # a restore reproduces the snapshot, so drop whatever was written since
+        cleared = [pool.submit(clear_table, dbclient, table) for table in meta['tables']]
+        cleared += [pool.submit(clear_bucket, s3client, bucket) for bucket in meta['buckets']]
+        for job in cleared:
+            job.result()
+
+        def submit(func, *args):
+            # bound memory by waiting on the oldest write when the window is full
+            if len(in_flight) >= 2 * SNAPSHOT['workers']:
+                in_flight.popleft().result()
+            in_flight.append(pool.submit(func, *args))
+
+        for record in records:
+            if record['kind'] == 'object':
+                counts[record['bucket']] = counts.get(record['bucket'], 0) + 1
+                submit(put_object, s3client, record)
+                continue
+            table = record['table']
+            counts[table] = counts.get(table, 0) + 1
+            buffer = buffers.setdefault(table, [])
+            buffer.append({'PutRequest': {'Item': record['item']}})
+            if len(buffer) >= SNAPSHOT['chunk_items']:
+                submit(resource.write_requests, dbclient, table, buffers.pop(table))
+        for table, buffer in buffers.items():
+            submit(resource.write_requests, dbclient, table, buffer)
+        while in_flight:
+            in_flight.popleft().result()
+    for resource_name in meta['tables'] + meta['buckets']:
+        logger.info(f"$[{resource_name}] \u279C $w[{counts.get(resource_name, 0)}]")
+    total = sum(counts.values())
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Restored $[{total}] records from $[{name}] in $w[{elapsed:.2f}s] ($w[{total / max(elapsed, 1e-6):.0f}] records/sec)")
+    return counts
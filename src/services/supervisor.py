@@ -0,0 +1,173 @@
+"""
+    services/supervisor.py
+    Process identity tracking and crash supervision for the Flask API and ngrok
+"""
+
+import time
+
+import psutil
+
+SUPERVISOR = {
+    'interval': 1,
+    'backoff': 1,
+    'max_backoff': 30,
+    'stable_after': 60,
+    'stop_timeout': 5,
+}
+
+
+def terminate_tree(proc, timeout=None):
+    """terminates proc and its descendants, killing any that outlive timeout
+
+    processes spawned through a shell leave the server as a child of the shell
+    """
+    timeout = SUPERVISOR['stop_timeout'] if timeout is None else timeout
+    try:
+        tree = [*proc.children(recursive=True), proc]
+    except psutil.Error:
+        tree = [proc]
+    for p in tree:
+        try:
+            p.terminate()
+        except psutil.Error:
+            pass
+    _, alive = psutil.wait_procs(tree, timeout=timeout)
+    for p in alive:
+        try:
+            p.kill()
+        except psutil.Error:
+            pass
+    psutil.wait_procs(alive, timeout=timeout)
+
+
+class ProcessRecord:
+    """A process saved in config by pid, create time and cmdline"""
+
+    def __init__(self, log, key, section='API'):
+        self.log = log
+        self.key = key
+        self.section = section
+
+    def _get(self, suffix=''):
+        return self.log.retrieve(self.section, self.key + suffix) or None
+
+    def save(self, proc, restarts=0):
+        """records proc, False if it has already exited"""
+        try:
+            ctime, cmd = proc.create_time(), ' '.join(proc.cmdline())
+        except psutil.Error:
+            self.log.save(self.section, f"{self.key}_RESTARTS", str(restarts))
+            return False
+        with self.log.batch():
+            self.log.save(self.section, self.key, str(proc.pid))
+            self.log.save(self.section, f"{self.key}_CTIME", repr(ctime))
+            self.log.save(self.section, f"{self.key}_CMD", cmd)
+            self.log.save(self.section, f"{self.key}_RESTARTS", str(restarts))
+        return True
+
+    def clear(self):
+        with self.log.batch():
+            for suffix in ('', '_CTIME', '_CMD'):
+                self.log.save(self.section, self.key + suffix, '')
+
+    @property
+    def pid(self):
+        return self._get()
+
+    @property
+    def restarts(self):
+        return int(self._get('_RESTARTS') or 0)
+
+    def process(self):
+        """the recorded process, if it is still the same one"""
+        try:
+            proc = psutil.Process(int(self.pid))
+            if proc.status() == psutil.STATUS_ZOMBIE:
+                return None
+            ctime, cmd = self._get('_CTIME'), self._get('_CMD')
+            if ctime is not None and abs(proc.create_time() - float(ctime)) > 0.01:
+                return None
+            if cmd is not None and ' '.join(proc.cmdline()) != cmd:
+                return None
+            return proc
+        except (TypeError, ValueError, psutil.Error):
+            return None
+
+    def stats(self):
+        """uptime, cpu, rss and restart count of the process tree"""
+        proc = self.process()
+        if proc is None:
+            return None
+        try:
+            tree = [proc, *proc.children(recursive=True)]
+            uptime = time.time() - proc.create_time()
+            cpu_time = sum(sum(p.cpu_times()[:2]) for p in tree)
+            rss = sum(p.memory_info().rss for p in tree)
+        except psutil.Error:
+            return None
+        return {
+            'uptime': uptime,
+            'cpu': 100 * cpu_time / max(uptime, 1e-6),
+            'rss': rss,
+            'restarts': self.restarts
+        }
+
+
+def format_stats(stats):
+    """stats as table cells"""
+    uptime = int(stats['uptime'])
+    return [f"{uptime // 3600}h{uptime % 3600 // 60:02d}m{uptime % 60:02d}s",
+            f"{stats['cpu']:.1f}%",
+            f"{stats['rss'] / 2 ** 20:.1f}MB",
+            stats['restarts']]
+
+
+class Supervisor:
+    """Restarts crashed processes with exponential backoff"""
+
+    def __init__(self, log, **config):
+        self.log = log
+        self.config = dict(SUPERVISOR, **config)
+        self.watched = {}
+
+    def watch(self, name, record, spawn):
+        """supervise the process in record, respawning it with spawn()"""
+        self.watched[name] = {'record': record, 'spawn': spawn,
+                              'backoff': self.config['backoff']}
+
+    def _check(self, name, entry):
+        record = entry['record']
+        if record.pid is None:
+            self.log.info(f"$[{name}] was stopped, no longer supervising it")
+            return self.watched.pop(name)
+        proc = record.process()
+        if proc is not None:
+            if time.time() - proc.create_time() > self.config['stable_after']:
+                entry['backoff'] = self.config['backoff']
+            return
+        restarts = record.restarts + 1
+        self.log.warn(
+            f"$[{name}] exited, restarting in $w[{entry['backoff']}s] (restart #{restarts})")
+        time.sleep(entry['backoff'])
+        entry['backoff'] = min(entry['backoff'] * 2, self.config['max_backoff'])
+        proc = entry['spawn']()
+        if proc is None:
+            return
+        if not record.save(proc, restarts=restarts):
+            # died before it could be recorded, the next check backs off again
+            proc.poll()
+            self.log.warn(f"$[{name}] exited as soon as it was restarted")
+
+    def run(self):
+        """blocks supervising all watched processes until interrupted"""
+        self.log.info(
+            f"Supervising $[{', '.join(self.watched)}], press $w[Ctrl+C] to stop")
+        try:
+            while self.watched:
+                procs = [e['record'].process() for e in self.watched.values()]
+                psutil.wait_procs([p for p in procs if p],
+                                  timeout=self.config['interval'])
+                for name, entry in list(self.watched.items()):
+                    self._check(name, entry)
+        except KeyboardInterrupt:
+            self.log.info("Supervisor stopped")
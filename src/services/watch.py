@@ -0,0 +1,206 @@
+"""
+    services/watch.py
+    Event driven status of the local services
+
+    Containers are followed through the Docker events API, recorded processes
+    through a pidfd (or psutil) wait and the config file through inotify, so
+    nothing is polled while the services are idle.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+
+import psutil
+
+from utils import ServiceLog
+
+from . import ServiceManager
+from .supervisor import ProcessRecord
+
+WATCH = {
+    # docker actions and whether the container is running afterwards
+    'actions': {'start': True, 'unpause': True, 'restart': True, 'die': False,
+                'stop': False, 'kill': False, 'pause': False, 'destroy': False},
+    # stat interval where inotify is unavailable
+    'fallback_interval': 2,
+}
+
+IN_CLOSE_WRITE = 0x08
+IN_MOVED_TO = 0x80
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def wait_exit(proc):
+    """blocks until proc exits, without polling where the kernel allows it"""
+    if hasattr(os, 'pidfd_open'):
+        try:
+            fd = os.pidfd_open(proc.pid)
+        except OSError:
+            return
+        try:
+            select.select([fd], [], [])
+        finally:
+            os.close(fd)
+        return
+    try:
+        proc.wait()
+    except psutil.Error:
+        pass
+
+
+def file_changes(path, on_watch=None):
+    """yields whenever path is rewritten in place or replaced, calling on_watch once watching"""
+    on_watch = on_watch or (lambda: None)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        fd = -1
+    if fd < 0:
+        yield from _stat_changes(path, on_watch)
+        return
+    if libc.inotify_add_watch(fd, str(path.parent).encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        yield from _stat_changes(path, on_watch)
+        return
+    on_watch()
+    try:
+        while True:
+            data, pos, names = os.read(fd, 4096), 0, set()
+            while pos < len(data):
+                length = INOTIFY_EVENT.unpack_from(data, pos)[3]
+                start = pos + INOTIFY_EVENT.size
+                names.add(data[start:start + length].rstrip(b'\0').decode())
+                pos = start + length
+            if path.name in names:
+                yield
+    finally:
+        os.close(fd)
+
+
+def _stat_changes(path, on_watch):
+    def stamp():
+        try:
+            st = path.stat()
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+    last = stamp()
+    on_watch()
+    while True:
+        time.sleep(WATCH['fallback_interval'])
+        current = stamp()
+        if current != last:
+            last = current
+            yield
+
+
+class Dashboard:
+    """Running state of services, updated from service events
+
+    rows are [name, running] only, as uptime and usage would go stale between events
+    """
+
+    def __init__(self, render, ids=None):
+        self.render = render
+        self.log = ServiceLog('Status', 'bright_cyan')
+        self.ids = ids or ServiceManager.SERVICE_LIST
+        self.rows = {}
+        self.events = queue.Queue()
+        self.records = {'api': ProcessRecord(self.log, 'PID'),
+                        'ngrok': ProcessRecord(self.log, 'NGROK_PID')}
+        self.watched = {}
+        self.notices = []
+        self.subscribed = {'docker': threading.Event(), 'config': threading.Event()}
+
+    def _spawn(self, target, *args):
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+    def _docker_events(self):
+        from .docker import DOCKER, get_client
+        ids = {DOCKER[id]['name']: id for id in self.ids if id in DOCKER}
+        if not ids:
+            return self.subscribed['docker'].set()
+        try:
+            events = get_client().events(
+                decode=True, filters={'type': 'container', 'container': list(ids)})
+            self.subscribed['docker'].set()
+            for event in events:
+                action = event.get('Action') or event.get('status')
+                name = event.get('Actor', {}).get('Attributes', {}).get('name')
+                if name in ids and action in WATCH['actions']:
+                    self.events.put(('docker', ids[name], WATCH['actions'][action]))
+        except Exception as e:
+            self.events.put(('error', 'docker', e))
+        finally:
+            self.subscribed['docker'].set()
+
+    def _process_exit(self, id, proc):
+        wait_exit(proc)
+        self.events.put(('exit', id, proc.pid))
+
+    def _config_changes(self):
+        for _ in file_changes(self.log.store.config_file, self.subscribed['config'].set):
+            self.events.put(('config', ))
+
+    def _refresh_processes(self):
+        """re-reads recorded processes, watching any that are new"""
+        for id, record in self.records.items():
+            if id not in self.rows:
+                continue
+            proc = record.process()
+            pid = proc.pid if proc else None
+            if pid != self.watched.get(id):
+                self.watched[id] = pid
+                if proc is not None:
+                    self._spawn(self._process_exit, id, proc)
+            self.rows[id] = [self.rows[id][0], proc is not None]
+
+    def apply(self, event):
+        kind, *args = event
+        if kind == 'docker':
+            id, running = args
+            self.rows[id] = [self.rows[id][0], running]
+        elif kind == 'exit':
+            id, pid = args
+            if self.watched.get(id) == pid:
+                self.watched[id] = None
+                self.rows[id] = [self.rows[id][0], False]
+        elif kind == 'config':
+            self._refresh_processes()
+        elif kind == 'error':
+            self.notices.append(f"Stopped watching {args[0]}: {args[1]}")
+
+    def snapshot(self):
+        """current state, taken once every event source is subscribed"""
+        for subscribed in self.subscribed.values():
+            subscribed.wait()
+        statuses = ServiceManager.status_all(self.ids)
+        self.rows = {id: status[:2] for id, status in zip(self.ids, statuses)}
+        self.rows['ngrok'] = ['ngrok', False]
+        self._refresh_processes()
+
+    def run(self):
+        """renders rows on every event until interrupted"""
+        self._spawn(self._docker_events)
+        self._spawn(self._config_changes)
+        self.snapshot()
+        self.draw()
+        try:
+            while True:
+                self.apply(self.events.get())
+                self.draw()
+        except KeyboardInterrupt:
+            pass
+
+    def draw(self):
+        self.render(list(self.rows.values()))
+        for notice in self.notices:
+            self.log.error(notice)
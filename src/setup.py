@@ -3,7 +3,7 @@ from setuptools import find_packages, setup
 setup(
     name='WarriorBeatCli',
     version='1.1.2',
-    py_modules=['run'],
+    py_modules=['run', 'utils', 'profiler'],
     packages=find_packages(),
     install_requires=[
         'Click',
@@ -12,10 +12,13 @@ setup(
         'tabulate',
         'art',
         'docker',
-        'boto3'
+        'boto3',
+        'tqdm'
     ],
     entry_points='''
         [console_scripts]
         wb=run:cli
+        [wbcli.services]
+        app=services.app:AppService
     '''
 )
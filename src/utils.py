@@ -6,14 +6,123 @@
 import configparser
 import os
 import re
+import threading
+import time
 from contextlib import contextmanager
 from pathlib import Path
 
 from click import clear, confirm, prompt, secho, style
 
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """exclusive advisory lock held on a sidecar lock file"""
+    with open(str(path), 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ConfigStore:
+    """config.ini loaded once per process with batched atomic writes"""
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.lock_file = config_file.with_suffix('.lock')
+        self.config = configparser.ConfigParser()
+        self.stamp = None
+        self.pending = {}
+        self.batch_depth = 0
+        self.lock = threading.RLock()
+
+    @classmethod
+    def open(cls, config_file):
+        """shared store for config_file"""
+        with cls._stores_lock:
+            if config_file not in cls._stores:
+                cls._stores[config_file] = cls(config_file)
+            return cls._stores[config_file]
+
+    def _stat(self):
+        try:
+            stat = self.config_file.stat()
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        """re-reads the file only when it changed on disk"""
+        stamp = self._stat()
+        if stamp != self.stamp:
+            self.config = configparser.ConfigParser()
+            if stamp is not None:
+                self.config.read(str(self.config_file))
+            self.stamp = stamp
+
+    def get(self, section, key):
+        with self.lock:
+            if (section, key) in self.pending:
+                return self.pending[(section, key)]
+            self._load()
+            return self.config.get(section, key, fallback=None)
+
+    def set(self, section, key, value):
+        with self.lock:
+            self.pending[(section, key)] = value
+            if not self.batch_depth:
+                self.flush()
+
+    @contextmanager
+    def batch(self):
+        """defers writes until the outermost batch exits"""
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+                if not self.batch_depth:
+                    self.flush()
+
+    def flush(self):
+        """merges pending values into the file under lock, then renames into place"""
+        with self.lock:
+            if not self.pending:
+                return
+            self.config_file.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.lock_file):
+                self.stamp = None
+                self._load()
+                for (section, key), value in self.pending.items():
+                    if not self.config.has_section(section):
+                        self.config.add_section(section)
+                    self.config.set(section, key, value)
+                tmp_file = self.config_file.with_name(
+                    f".{self.config_file.name}.{os.getpid()}.tmp")
+                with tmp_file.open(mode='w') as cfile:
+                    self.config.write(cfile)
+                    cfile.flush()
+                    os.fsync(cfile.fileno())
+                os.replace(str(tmp_file), str(self.config_file))
+                self.stamp = self._stat()
+            self.pending = {}
+
 
 class ServiceLog:
     """Logging for Services"""
+    echo_lock = threading.Lock()
 
     def __init__(self, service_name, base_color, **kwargs):
         self.is_root = kwargs.get('root', False)
@@ -49,9 +158,11 @@ class ServiceLog:
         service_title = self.get_service(fg=title_color, bold=title_bold)
         title = f"{self.parent_name} {service_title if not self.is_root else ''}"
         message = self.parse_msg(msg, accent_color)
-        secho(
-            f"{title} ", nl=False)
-        secho(message, **kwargs)
+        # title and message are separate writes, keep threads from interleaving them
+        with self.echo_lock:
+            secho(
+                f"{title} ", nl=False)
+            secho(message, **kwargs)
 
     def info(self, msg, **kwargs):
         return self.echo(msg, **kwargs)
@@ -85,30 +196,23 @@ class ServiceLog:
         secho(f"{self.parent_name} {title} ", nl=False)
         return confirm(msg, show_default="[y/N] ", prompt_suffix=suffix, **kwargs)
 
+    @property
+    def store(self):
+        return ConfigStore.open(self.config_path / 'config.ini')
+
     def save(self, section, key, value):
-        if not self.config_path.exists():
-            self.config_path.mkdir(parents=True, exist_ok=True)
-        config_file = self.config_path / 'config.ini'
-        config = configparser.ConfigParser()
-        if config_file.exists():
-            config.read(config_file)
-        try:
-            config.set(section, key, value)
-        except configparser.NoSectionError:
-            config.add_section(section)
-            config.set(section, key, value)
-        with config_file.open(mode='w') as cfile:
-            config.write(cfile)
+        self.store.set(section, key, value)
 
     def retrieve(self, section, key):
-        config_file = self.config_path / 'config.ini'
-        config = configparser.ConfigParser()
         try:
-            config.read(config_file)
-            return config.get(section, key)
+            return self.store.get(section, key)
         except Exception:
             return None
 
+    def batch(self):
+        """groups several saves into one write"""
+        return self.store.batch()
+
     def diff_print(self, diff):
         for line in iter(diff, b''):
             line = line.decode('utf-8').rstrip()
@@ -135,3 +239,18 @@ def ch_dir(path):
     cur_dir = Path.cwd()
     yield os.chdir(str(path))
     os.chdir(cur_dir)
+
+
+_timed_lock = threading.Lock()
+
+
+@contextmanager
+def timed(label, timings):
+    """accumulates elapsed wall time of a block under label"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _timed_lock:
+            timings[label] = timings.get(label, 0) + elapsed